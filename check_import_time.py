@@ -0,0 +1,63 @@
+#!/usr/local/bin/python3
+
+"""Check that importing mgbdis stays fast, using python -X importtime"""
+
+import os
+import subprocess
+import sys
+
+# modules that should only be imported when the feature that needs them is used
+lazy_modules = ['argparse', 'hashlib', 'json', 'pickle', 'shutil', 'glob', 'instruction_set', 'http.server', 'socketserver', 'emulator']
+
+# maximum cumulative import time of mgbdis in microseconds, for the fastest of several imports so
+# that a busy machine does not make the check fail
+import_time_budget = 50000
+import_time_runs = 5
+
+
+def measure_import_times():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import mgbdis'],
+        cwd=script_dir,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True
+    )
+
+    # lines are in the format "import time: self [us] | cumulative | imported package"
+    import_times = dict()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            self_time, cumulative_time, module = line[len('import time:'):].split('|')
+            if cumulative_time.strip().isdigit():
+                import_times[module.strip()] = int(cumulative_time)
+
+    return import_times
+
+
+def check_import_time():
+    runs = [measure_import_times() for run in range(import_time_runs)]
+    import_times = min(runs, key=lambda times: times.get('mgbdis', 0))
+
+    errors = list()
+
+    for module in lazy_modules:
+        if module in import_times:
+            errors.append('{} is imported when importing mgbdis'.format(module))
+
+    if import_times.get('mgbdis', 0) > import_time_budget:
+        errors.append('importing mgbdis took {}us, the budget is {}us'.format(import_times['mgbdis'], import_time_budget))
+
+    print('Importing mgbdis took {}us'.format(import_times.get('mgbdis')))
+
+    return errors
+
+
+if __name__ == '__main__':
+    errors = check_import_time()
+
+    for error in errors:
+        print(error)
+
+    sys.exit(1 if len(errors) else 0)
@@ -0,0 +1,763 @@
+"""Headless Game Boy CPU emulator, used by mgbdis to find the code that is executed by a ROM
+
+Only the CPU, the memory bank controller and the few IO registers that games wait on (LY, STAT,
+DIV, the timer and the vblank interrupt) are emulated. Nothing is drawn, no sound is played and no
+buttons are ever pressed.
+
+The handler for each opcode is generated from the instruction table when the module is imported,
+so running an instruction is a single lookup and call.
+"""
+
+from instruction_table import instruction_names, instruction_operands, cb_instruction_names, cb_instruction_operands
+
+CYCLES_PER_LINE = 456
+CYCLES_PER_FRAME = 70224
+VBLANK_CYCLES = 144 * CYCLES_PER_LINE
+
+# cycles for each opcode when a conditional branch is not taken
+instruction_cycles = (
+    4, 12, 8, 8, 4, 4, 8, 4, 20, 8, 8, 8, 4, 4, 8, 4,
+    4, 12, 8, 8, 4, 4, 8, 4, 12, 8, 8, 8, 4, 4, 8, 4,
+    8, 12, 8, 8, 4, 4, 8, 4, 8, 8, 8, 8, 4, 4, 8, 4,
+    8, 12, 8, 8, 12, 12, 12, 4, 8, 8, 8, 8, 4, 4, 8, 4,
+) + tuple(
+    # ld, alu and halt instructions take an extra 4 cycles to access [hl]
+    8 if (opcode & 7 == 6 or 0x70 <= opcode <= 0x77) and opcode != 0x76 else 4
+    for opcode in range(0x40, 0xc0)
+) + (
+    8, 12, 12, 16, 12, 16, 8, 16, 8, 16, 12, 4, 12, 24, 8, 16,
+    8, 12, 12, 0, 12, 16, 8, 16, 8, 16, 12, 0, 12, 0, 8, 16,
+    12, 12, 8, 0, 0, 16, 8, 16, 16, 4, 16, 0, 0, 0, 8, 16,
+    12, 12, 8, 4, 0, 16, 8, 16, 12, 8, 16, 4, 0, 0, 8, 16,
+)
+
+# extra cycles for conditional branches that are taken
+branch_cycles = {
+    'jr': 4,
+    'jp': 4,
+    'call': 12,
+    'ret': 12
+}
+
+# timer period in cycles for each TAC clock select value
+timer_periods = (1024, 16, 64, 256)
+
+registers = ('a', 'b', 'c', 'd', 'e', 'h', 'l')
+
+register_pairs = {
+    'bc': ('b', 'c'),
+    'de': ('d', 'e'),
+    'hl': ('h', 'l')
+}
+
+conditions = {
+    'nz': 'not s.f & 0x80',
+    'z': 's.f & 0x80',
+    'nc': 'not s.f & 0x10',
+    'c': 's.f & 0x10'
+}
+
+operand_lengths = {
+    'd8': 1,
+    'r8': 1,
+    'pc+r8': 1,
+    'sp+r8': 1,
+    '[$ff00+a8]': 1,
+    'd16': 2,
+    'a16': 2,
+    '[a16]': 2
+}
+
+# memory addresses of the 8 bit operands
+operand_addresses = {
+    '[hl]': '(s.h << 8) | s.l',
+    '[bc]': '(s.b << 8) | s.c',
+    '[de]': '(s.d << 8) | s.e',
+    '[a16]': 's.fetch(pc + 1) | (s.fetch(pc + 2) << 8)',
+    '[$ff00+a8]': '0xff00 | s.fetch(pc + 1)',
+    '[$ff00+c]': '0xff00 | s.c'
+}
+
+
+def instruction_length(opcode):
+    if opcode == 0xcb:
+        return 2
+    if opcode == 0x10:
+        # stop is followed by a padding byte
+        return 2
+    return 1 + sum(operand_lengths.get(operand, 0) for operand in instruction_operands[opcode])
+
+
+instruction_lengths = tuple(instruction_length(opcode) for opcode in range(256))
+
+
+
+class IllegalInstruction(Exception):
+    pass
+
+
+
+def read_operand(operand):
+    if operand in registers:
+        return 's.' + operand
+    if operand == 'd8':
+        return 's.fetch(pc + 1)'
+    return 's.read({})'.format(operand_addresses[operand])
+
+
+def write_operand(operand, value):
+    if operand in registers:
+        return 's.{} = {}'.format(operand, value)
+    return 's.write({}, {})'.format(operand_addresses[operand], value)
+
+
+def read_pair(pair):
+    if pair == 'sp':
+        return 's.sp'
+    high, low = register_pairs[pair]
+    return '(s.{} << 8) | s.{}'.format(high, low)
+
+
+def write_pair(pair, value):
+    if pair == 'sp':
+        return ['s.sp = {}'.format(value)]
+    high, low = register_pairs[pair]
+    return ['v = {}'.format(value), 's.{} = v >> 8'.format(high), 's.{} = v & 0xff'.format(low)]
+
+
+def push(value):
+    return [
+        'sp = (s.sp - 2) & 0xffff',
+        's.sp = sp',
+        'v = {}'.format(value),
+        's.write((sp + 1) & 0xffff, v >> 8)',
+        's.write(sp, v & 0xff)'
+    ]
+
+
+def pop(name):
+    return [
+        'sp = s.sp',
+        '{} = s.read(sp) | (s.read((sp + 1) & 0xffff) << 8)'.format(name),
+        's.sp = (sp + 2) & 0xffff'
+    ]
+
+
+def alu(name, value):
+    """
+    Statements for an 8 bit arithmetic or logic instruction on the a register.
+    """
+    lines = ['v = ' + value]
+
+    if name == 'add':
+        lines += [
+            'r = s.a + v',
+            's.f = (0 if r & 0xff else 0x80) | (0x20 if (s.a & 0xf) + (v & 0xf) > 0xf else 0) | (0x10 if r > 0xff else 0)',
+            's.a = r & 0xff'
+        ]
+    elif name == 'adc':
+        lines += [
+            'carry = (s.f >> 4) & 1',
+            'r = s.a + v + carry',
+            's.f = (0 if r & 0xff else 0x80) | (0x20 if (s.a & 0xf) + (v & 0xf) + carry > 0xf else 0) | (0x10 if r > 0xff else 0)',
+            's.a = r & 0xff'
+        ]
+    elif name in ['sub', 'cp']:
+        lines += [
+            'r = s.a - v',
+            's.f = 0x40 | (0 if r & 0xff else 0x80) | (0x20 if (s.a & 0xf) < (v & 0xf) else 0) | (0x10 if r < 0 else 0)'
+        ]
+        if name == 'sub':
+            lines.append('s.a = r & 0xff')
+    elif name == 'sbc':
+        lines += [
+            'carry = (s.f >> 4) & 1',
+            'r = s.a - v - carry',
+            's.f = 0x40 | (0 if r & 0xff else 0x80) | (0x20 if (s.a & 0xf) - (v & 0xf) - carry < 0 else 0) | (0x10 if r < 0 else 0)',
+            's.a = r & 0xff'
+        ]
+    elif name == 'and':
+        lines += ['s.a &= v', 's.f = 0x20 if s.a else 0xa0']
+    elif name == 'xor':
+        lines += ['s.a ^= v', 's.f = 0 if s.a else 0x80']
+    elif name == 'or':
+        lines += ['s.a |= v', 's.f = 0 if s.a else 0x80']
+
+    return lines
+
+
+def rotate(name, value):
+    """
+    Statements for a cb prefixed rotate or shift, setting r to the result and c to the carry.
+    """
+    return {
+        'rlc': ['c = v >> 7', 'r = ((v << 1) | c) & 0xff'],
+        'rrc': ['c = v & 1', 'r = (v >> 1) | (c << 7)'],
+        'rl': ['c = v >> 7', 'r = ((v << 1) | ((s.f >> 4) & 1)) & 0xff'],
+        'rr': ['c = v & 1', 'r = (v >> 1) | ((s.f & 0x10) << 3)'],
+        'sla': ['c = v >> 7', 'r = (v << 1) & 0xff'],
+        'sra': ['c = v & 1', 'r = (v >> 1) | (v & 0x80)'],
+        'srl': ['c = v & 1', 'r = v >> 1'],
+        'swap': ['c = 0', 'r = ((v & 0xf) << 4) | (v >> 4)']
+    }[name]
+
+
+def generate_instruction(opcode):
+    """
+    Return the statements of the handler for an opcode, and the number of bytes it uses. Handlers
+    that change pc themselves return a length of None.
+    """
+    name = instruction_names[opcode]
+    operands = instruction_operands[opcode]
+    length = instruction_lengths[opcode]
+    taken = 'return {}'.format(instruction_cycles[opcode] + branch_cycles.get(name, 0))
+
+    if name == 'DB':
+        return ['raise IllegalInstruction(pc)'], None
+
+    if name in ['nop', 'stop']:
+        return [], length
+
+    if name == 'halt':
+        return ['s.halted = True'], length
+
+    if name == 'di':
+        return ['s.ime = False'], length
+
+    if name == 'ei':
+        return ['s.ime = True'], length
+
+    if name == 'ld':
+        destination, source = operands
+
+        if destination in ['[hli]', '[hld]'] or source in ['[hli]', '[hld]']:
+            step = '+ 1' if '[hli]' in operands else '- 1'
+            if destination == 'a':
+                lines = ['hl = (s.h << 8) | s.l', 's.a = s.read(hl)']
+            else:
+                lines = ['hl = (s.h << 8) | s.l', 's.write(hl, s.a)']
+            return lines + write_pair('hl', '(hl {}) & 0xffff'.format(step)), length
+
+        if destination in register_pairs or destination == 'sp':
+            if source == 'd16':
+                return write_pair(destination, 's.fetch(pc + 1) | (s.fetch(pc + 2) << 8)'), length
+            if source == 'hl':
+                return ['s.sp = (s.h << 8) | s.l'], length
+            if source == 'sp+r8':
+                return [
+                    'u = s.fetch(pc + 1)',
+                    'sp = s.sp',
+                    's.f = (0x20 if (sp & 0xf) + (u & 0xf) > 0xf else 0) | (0x10 if (sp & 0xff) + u > 0xff else 0)'
+                ] + write_pair('hl', '(sp + u - (u & 0x80) * 2) & 0xffff'), length
+
+        if destination == '[a16]' and source == 'sp':
+            return [
+                'address = s.fetch(pc + 1) | (s.fetch(pc + 2) << 8)',
+                's.write(address, s.sp & 0xff)',
+                's.write((address + 1) & 0xffff, s.sp >> 8)'
+            ], length
+
+        return [write_operand(destination, read_operand(source))], length
+
+    if name in ['add', 'adc', 'sub', 'sbc', 'and', 'xor', 'or', 'cp']:
+        if len(operands) == 1:
+            return alu(name, read_operand(operands[0])), length
+
+        if operands[0] == 'hl':
+            return [
+                'hl = (s.h << 8) | s.l',
+                'v = ' + read_pair(operands[1]),
+                'r = hl + v',
+                's.f = (s.f & 0x80) | (0x20 if (hl & 0xfff) + (v & 0xfff) > 0xfff else 0) | (0x10 if r > 0xffff else 0)'
+            ] + write_pair('hl', 'r & 0xffff'), length
+
+        # add sp, r8
+        return [
+            'u = s.fetch(pc + 1)',
+            'sp = s.sp',
+            's.f = (0x20 if (sp & 0xf) + (u & 0xf) > 0xf else 0) | (0x10 if (sp & 0xff) + u > 0xff else 0)',
+            's.sp = (sp + u - (u & 0x80) * 2) & 0xffff'
+        ], length
+
+    if name in ['inc', 'dec']:
+        operand = operands[0]
+        step = '+ 1' if name == 'inc' else '- 1'
+
+        if operand in register_pairs or operand == 'sp':
+            return write_pair(operand, '({} {}) & 0xffff'.format(read_pair(operand), step)), length
+
+        if name == 'inc':
+            flags = 's.f = (s.f & 0x10) | (0 if v else 0x80) | (0 if v & 0xf else 0x20)'
+        else:
+            flags = 's.f = (s.f & 0x10) | 0x40 | (0 if v else 0x80) | (0x20 if v & 0xf == 0xf else 0)'
+
+        return [
+            'v = ({} {}) & 0xff'.format(read_operand(operand), step),
+            flags,
+            write_operand(operand, 'v')
+        ], length
+
+    if name in ['jp', 'jr', 'call']:
+        target = operands[-1]
+        if target == 'hl':
+            return ['s.pc = (s.h << 8) | s.l'], None
+
+        if target == 'pc+r8':
+            lines = ['u = s.fetch(pc + 1)', 'target = (pc + 2 + u - (u & 0x80) * 2) & 0xffff']
+        else:
+            lines = ['target = s.fetch(pc + 1) | (s.fetch(pc + 2) << 8)']
+
+        jump = list()
+        if name == 'call':
+            jump += push('(pc + 3) & 0xffff')
+        if name != 'jr':
+            # record calls and jumps from bank 0 into the switchable bank, which go to the bank that is switched in
+            jump.append('if pc < 0x4000 <= target < 0x8000: s.record_far_jump(pc, target)')
+        jump.append('s.pc = target')
+
+        if len(operands) == 1:
+            return lines + jump + [taken], None
+
+        return lines + [
+            'if {}:'.format(conditions[operands[0]])
+        ] + ['    ' + line for line in jump + [taken]] + [
+            's.pc = (pc + {}) & 0xffff'.format(length)
+        ], None
+
+    if name in ['ret', 'reti']:
+        lines = pop('s.pc')
+        if name == 'reti':
+            lines.append('s.ime = True')
+
+        if len(operands) == 0:
+            return lines, None
+
+        return [
+            'if {}:'.format(conditions[operands[0]])
+        ] + ['    ' + line for line in lines + [taken]] + [
+            's.pc = (pc + 1) & 0xffff'
+        ], None
+
+    if name == 'rst':
+        return push('(pc + 1) & 0xffff') + ['s.pc = ' + operands[0].replace('$', '0x')], None
+
+    if name == 'push':
+        if operands[0] == 'af':
+            return push('(s.a << 8) | s.f'), length
+        return push(read_pair(operands[0])), length
+
+    if name == 'pop':
+        if operands[0] == 'af':
+            return pop('v') + ['s.a = v >> 8', 's.f = v & 0xf0'], length
+        return pop('r') + write_pair(operands[0], 'r'), length
+
+    if name in ['rlca', 'rrca', 'rla', 'rra']:
+        return ['v = s.a'] + rotate(name[:-1], 'v') + ['s.a = r', 's.f = c << 4'], length
+
+    if name == 'daa':
+        return [
+            'a = s.a',
+            'f = s.f',
+            'if not f & 0x40:',
+            '    if f & 0x10 or a > 0x99:',
+            '        a += 0x60',
+            '        f |= 0x10',
+            '    if f & 0x20 or a & 0xf > 0x9:',
+            '        a += 0x6',
+            'else:',
+            '    if f & 0x10:',
+            '        a -= 0x60',
+            '    if f & 0x20:',
+            '        a -= 0x6',
+            'a &= 0xff',
+            's.a = a',
+            's.f = (f & 0x50) | (0 if a else 0x80)'
+        ], length
+
+    if name == 'cpl':
+        return ['s.a ^= 0xff', 's.f |= 0x60'], length
+
+    if name == 'scf':
+        return ['s.f = (s.f & 0x80) | 0x10'], length
+
+    if name == 'ccf':
+        return ['s.f = (s.f & 0x80) | ((s.f & 0x10) ^ 0x10)'], length
+
+    if name == 'CBPREFIX':
+        return ['return cb_handlers[s.fetch(pc + 1)](s)'], None
+
+    raise ValueError('No handler for {} {}'.format(name, operands))
+
+
+def generate_cb_instruction(opcode):
+    name = cb_instruction_names[opcode]
+    operands = cb_instruction_operands[opcode]
+    operand = operands[-1]
+
+    lines = ['v = ' + read_operand(operand)]
+
+    if name == 'bit':
+        lines.append('s.f = (s.f & 0x10) | 0x20 | (0 if v & {} else 0x80)'.format(1 << int(operands[0])))
+    elif name == 'res':
+        lines.append(write_operand(operand, 'v & {}'.format(0xff ^ (1 << int(operands[0])))))
+    elif name == 'set':
+        lines.append(write_operand(operand, 'v | {}'.format(1 << int(operands[0]))))
+    else:
+        lines += rotate(name, 'v')
+        lines += ['s.f = (0 if r else 0x80) | (c << 4)', write_operand(operand, 'r')]
+
+    return lines
+
+
+def compile_handlers():
+    """
+    Generate the source of a handler function for every opcode and compile them all at once.
+    Each handler runs the instruction at s.pc and returns the number of cycles it took.
+    """
+    source = list()
+
+    for opcode in range(256):
+        lines, length = generate_instruction(opcode)
+        source.append('def op_{:02x}(s):'.format(opcode))
+        source.append('    pc = s.pc')
+        source += ['    ' + line for line in lines]
+        if length is not None:
+            source.append('    s.pc = (pc + {}) & 0xffff'.format(length))
+        if not lines or not lines[-1].startswith(('return', 'raise')):
+            source.append('    return {}'.format(instruction_cycles[opcode]))
+
+    for opcode in range(256):
+        if cb_instruction_operands[opcode][-1] != '[hl]':
+            cycles = 8
+        elif cb_instruction_names[opcode] == 'bit':
+            cycles = 12
+        else:
+            cycles = 16
+
+        source.append('def cb_{:02x}(s):'.format(opcode))
+        source.append('    pc = s.pc')
+        source += ['    ' + line for line in generate_cb_instruction(opcode)]
+        source.append('    s.pc = (pc + 2) & 0xffff')
+        source.append('    return {}'.format(cycles))
+
+    source.append('handlers = ({},)'.format(', '.join('op_{:02x}'.format(opcode) for opcode in range(256))))
+    source.append('cb_handlers = ({},)'.format(', '.join('cb_{:02x}'.format(opcode) for opcode in range(256))))
+
+    namespace = {'IllegalInstruction': IllegalInstruction}
+    exec(compile('\n'.join(source), '<emulator handlers>', 'exec'), namespace)
+    return namespace['handlers'], namespace['cb_handlers']
+
+
+handlers, cb_handlers = compile_handlers()
+
+
+
+class Emulator:
+    """
+    Runs a ROM from the entry point, recording the rom addresses of the instructions that are
+    executed and the rom bytes that are read as data.
+    """
+
+    def __init__(self, rom, gbc = False):
+        # make sure there are at least 2 banks so bank 1 can always be switched in
+        self.rom = bytes(rom).ljust(0x8000, b'\xff')
+        self.num_banks = len(self.rom) // 0x4000
+
+        # flags for each byte of the rom
+        self.executed = bytearray(len(self.rom))
+        self.data_reads = bytearray(len(self.rom))
+
+        # rom addresses of the targets of each call or jump from bank 0 to the switchable bank
+        self.far_jumps = dict()
+
+        # rom banks that have been switched in
+        self.switched_banks = {1}
+
+        cartridge_type = self.rom[0x147]
+        if cartridge_type in [0x01, 0x02, 0x03]:
+            self.mbc = 1
+        elif cartridge_type in [0x05, 0x06]:
+            self.mbc = 2
+        elif 0x0f <= cartridge_type <= 0x13:
+            self.mbc = 3
+        elif 0x19 <= cartridge_type <= 0x1e:
+            self.mbc = 5
+        else:
+            self.mbc = 0
+
+        self.rom_bank = 1
+        self.rom_bank_high = 0
+        self.ram_bank = 0
+        self.banking_mode = 0
+
+        # added to an address in the switchable bank to get the rom address
+        self.rom_offset = 0
+        self.ram_offset = 0
+
+        self.memory = bytearray(0x10000)
+        self.cart_ram = bytearray(0x20000)
+
+        # register values after the boot rom has run
+        if gbc:
+            self.a, self.f, self.b, self.c, self.d, self.e, self.h, self.l = 0x11, 0x80, 0x00, 0x00, 0xff, 0x56, 0x00, 0x0d
+        else:
+            self.a, self.f, self.b, self.c, self.d, self.e, self.h, self.l = 0x01, 0xb0, 0x00, 0x13, 0x00, 0xd8, 0x01, 0x4d
+        self.sp = 0xfffe
+        self.pc = 0x0100
+        self.ime = False
+        self.halted = False
+
+        self.memory[0xff40] = 0x91
+        self.memory[0xff47] = 0xfc
+
+        self.cycles = 0
+        self.instruction_count = 0
+        self.next_vblank = VBLANK_CYCLES
+        self.next_timer = None
+        self.next_event = self.next_vblank
+
+        # address of the illegal instruction that stopped the emulation, if any
+        self.stopped_at = None
+
+
+    def run(self, frames):
+        end_cycles = self.cycles + frames * CYCLES_PER_FRAME
+        rom = self.rom
+        memory = self.memory
+        executed = self.executed
+        count = 0
+
+        try:
+            while self.cycles < end_cycles:
+                if self.cycles >= self.next_event:
+                    self.update_events()
+
+                if memory[0xffff] & memory[0xff0f] & 0x1f:
+                    self.halted = False
+                    if self.ime:
+                        self.interrupt()
+                elif self.halted:
+                    # nothing happens until the next interrupt
+                    self.cycles = self.next_event
+                    continue
+
+                pc = self.pc
+                if pc < 0x4000:
+                    executed[pc] = 1
+                    opcode = rom[pc]
+                elif pc < 0x8000:
+                    pc += self.rom_offset
+                    executed[pc] = 1
+                    opcode = rom[pc]
+                else:
+                    opcode = self.read(pc)
+
+                self.cycles += handlers[opcode](self)
+                count += 1
+
+        except IllegalInstruction as e:
+            self.stopped_at = e.args[0]
+
+        self.instruction_count += count
+
+
+    def update_events(self):
+        memory = self.memory
+
+        if self.cycles >= self.next_vblank:
+            memory[0xff0f] |= 0x01
+            self.next_vblank += CYCLES_PER_FRAME
+
+        if self.next_timer is not None and self.cycles >= self.next_timer:
+            memory[0xff0f] |= 0x04
+            memory[0xff05] = memory[0xff06]
+            self.next_timer += (256 - memory[0xff06]) * timer_periods[memory[0xff07] & 3]
+
+        self.next_event = self.next_vblank if self.next_timer is None else min(self.next_vblank, self.next_timer)
+
+
+    def reset_timer(self):
+        memory = self.memory
+        if memory[0xff07] & 0x04:
+            self.next_timer = self.cycles + (256 - memory[0xff05]) * timer_periods[memory[0xff07] & 3]
+        else:
+            self.next_timer = None
+        self.next_event = self.cycles
+
+
+    def interrupt(self):
+        memory = self.memory
+        pending = memory[0xffff] & memory[0xff0f] & 0x1f
+        interrupt = (pending & -pending).bit_length() - 1
+
+        memory[0xff0f] &= 0xff ^ (1 << interrupt)
+        self.ime = False
+
+        sp = (self.sp - 2) & 0xffff
+        self.sp = sp
+        self.write((sp + 1) & 0xffff, self.pc >> 8)
+        self.write(sp, self.pc & 0xff)
+
+        self.pc = 0x40 + interrupt * 8
+        self.cycles += 20
+
+
+    def record_far_jump(self, pc, target):
+        targets = self.far_jumps.get(pc)
+        if targets is None:
+            targets = self.far_jumps[pc] = set()
+        targets.add(self.rom_offset + target)
+
+
+    def fetch(self, address):
+        # read an instruction byte
+        if address < 0x4000:
+            return self.rom[address]
+        if address < 0x8000:
+            return self.rom[self.rom_offset + address]
+        return self.read(address)
+
+
+    def read(self, address):
+        if address < 0x4000:
+            self.data_reads[address] = 1
+            return self.rom[address]
+
+        if address < 0x8000:
+            address += self.rom_offset
+            self.data_reads[address] = 1
+            return self.rom[address]
+
+        if address < 0xa000:
+            return self.memory[address]
+
+        if address < 0xc000:
+            return self.cart_ram[self.ram_offset + address - 0xa000]
+
+        if address < 0xff00:
+            if 0xe000 <= address < 0xfe00:
+                # echo ram
+                address -= 0x2000
+            return self.memory[address]
+
+        if address >= 0xff80:
+            return self.memory[address]
+
+        if address == 0xff44:
+            return (self.cycles % CYCLES_PER_FRAME) // CYCLES_PER_LINE
+
+        if address == 0xff41:
+            line = (self.cycles % CYCLES_PER_FRAME) // CYCLES_PER_LINE
+            dot = self.cycles % CYCLES_PER_LINE
+            if line >= 144:
+                mode = 1
+            elif dot < 80:
+                mode = 2
+            elif dot < 252:
+                mode = 3
+            else:
+                mode = 0
+            return 0x80 | (self.memory[0xff41] & 0x78) | (0x04 if line == self.memory[0xff45] else 0) | mode
+
+        if address == 0xff04:
+            return (self.cycles >> 8) & 0xff
+
+        if address == 0xff00:
+            # no buttons are pressed
+            return 0xcf | (self.memory[0xff00] & 0x30)
+
+        return self.memory[address]
+
+
+    def write(self, address, value):
+        if address < 0x8000:
+            self.write_mbc(address, value)
+
+        elif address < 0xa000:
+            self.memory[address] = value
+
+        elif address < 0xc000:
+            self.cart_ram[self.ram_offset + address - 0xa000] = value
+
+        elif address < 0xff00:
+            if 0xe000 <= address < 0xfe00:
+                address -= 0x2000
+            self.memory[address] = value
+
+        else:
+            self.memory[address] = value
+
+            if address == 0xff46:
+                # oam dma
+                source = value << 8
+                for offset in range(0xa0):
+                    self.memory[0xfe00 + offset] = self.read(source + offset)
+
+            elif 0xff05 <= address <= 0xff07:
+                self.reset_timer()
+
+
+    def write_mbc(self, address, value):
+        mbc = self.mbc
+
+        if mbc == 1:
+            if 0x2000 <= address < 0x4000:
+                self.rom_bank = value & 0x1f or 1
+            elif 0x4000 <= address < 0x6000:
+                self.rom_bank_high = value & 0x03
+            elif 0x6000 <= address < 0x8000:
+                self.banking_mode = value & 0x01
+
+            if self.banking_mode:
+                self.ram_bank = self.rom_bank_high
+                self.switch_rom_bank(self.rom_bank)
+            else:
+                self.ram_bank = 0
+                self.switch_rom_bank((self.rom_bank_high << 5) | self.rom_bank)
+
+        elif mbc == 2:
+            if address < 0x4000 and address & 0x100:
+                self.switch_rom_bank(value & 0x0f or 1)
+
+        elif mbc == 3:
+            if 0x2000 <= address < 0x4000:
+                self.switch_rom_bank(value & 0x7f or 1)
+            elif 0x4000 <= address < 0x6000 and value < 4:
+                self.ram_bank = value
+
+        elif mbc == 5:
+            if 0x2000 <= address < 0x3000:
+                self.rom_bank = value
+                self.switch_rom_bank((self.rom_bank_high << 8) | value)
+            elif 0x3000 <= address < 0x4000:
+                self.rom_bank_high = value & 0x01
+                self.switch_rom_bank((self.rom_bank_high << 8) | self.rom_bank)
+            elif 0x4000 <= address < 0x6000:
+                self.ram_bank = value & 0x0f
+
+        self.ram_offset = (self.ram_bank * 0x2000) % len(self.cart_ram)
+
+
+    def switch_rom_bank(self, bank):
+        bank %= self.num_banks
+        self.switched_banks.add(bank)
+        self.rom_offset = bank * 0x4000 - 0x4000
+
+
+    def get_code_data_log(self, size):
+        """
+        Return the flags for the first size bytes of the rom in the same format as a code/data
+        log: bit 0 for bytes of executed instructions and bit 1 for bytes read as data.
+        """
+        code = bytearray(len(self.rom))
+
+        executed = self.executed
+        address = executed.find(1)
+        while address != -1:
+            length = min(instruction_lengths[self.rom[address]], len(code) - address)
+            code[address:address + length] = b'\x01' * length
+            address = executed.find(1, address + 1)
+
+        data = self.data_reads.translate(bytes([0, 0x02]) + bytes(254))
+        flags = int.from_bytes(code, 'big') | int.from_bytes(data, 'big')
+        return flags.to_bytes(len(self.rom), 'big')[:size]
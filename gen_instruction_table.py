@@ -0,0 +1,90 @@
+#!/usr/local/bin/python3
+
+"""Generate instruction_table.py from the instruction definitions in instruction_set.py"""
+
+import os
+import sys
+
+from instruction_set import instructions, cb_instructions
+
+table_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'instruction_table.py')
+
+# number of bytes used by each type of operand
+operand_lengths = {
+    'd8': 1,
+    'r8': 1,
+    'pc+r8': 1,
+    'sp+r8': 1,
+    '[$ff00+a8]': 1,
+    'd16': 2,
+    'a16': 2,
+    '[a16]': 2
+}
+
+
+def split_instructions(instruction_set):
+    names = list()
+    operands = list()
+
+    for opcode in range(256):
+        instruction_parts = instruction_set[opcode].split()
+        names.append(instruction_parts[0])
+        if len(instruction_parts) > 1:
+            operands.append(tuple(instruction_parts[1].split(',')))
+        else:
+            operands.append(tuple())
+
+    return tuple(names), tuple(operands)
+
+
+def get_instruction_lengths(instruction_operands):
+    lengths = bytearray()
+
+    for opcode in range(256):
+        if opcode == 0xcb:
+            # all the instructions after the prefix are a single byte
+            lengths.append(2)
+        else:
+            lengths.append(1 + sum(operand_lengths.get(operand, 0) for operand in instruction_operands[opcode]))
+
+    return bytes(lengths)
+
+
+def generate_table():
+    instruction_names, instruction_operands = split_instructions(instructions)
+    cb_instruction_names, cb_instruction_operands = split_instructions(cb_instructions)
+    instruction_lengths = get_instruction_lengths(instruction_operands)
+
+    lines = [
+        '# Generated by gen_instruction_table.py from instruction_set.py, do not edit.',
+        '# Each tuple is indexed by opcode.',
+        '',
+        'instruction_names = {!r}'.format(instruction_names),
+        '',
+        'instruction_operands = {!r}'.format(instruction_operands),
+        '',
+        'cb_instruction_names = {!r}'.format(cb_instruction_names),
+        '',
+        'cb_instruction_operands = {!r}'.format(cb_instruction_operands),
+        '',
+        '# length of the instruction starting with each opcode, as bytes so it can be used as a',
+        '# translation table. stop and halt do not include the nop rgbds adds after them',
+        'instruction_lengths = {!r}'.format(instruction_lengths),
+        ''
+    ]
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    table = generate_table()
+
+    if '--check' in sys.argv[1:]:
+        # exit with an error if instruction_table.py is out of date
+        if not os.path.isfile(table_path) or open(table_path, 'r').read() != table:
+            print('instruction_table.py is out of date, run gen_instruction_table.py')
+            sys.exit(1)
+    else:
+        f = open(table_path, 'w')
+        f.write(table)
+        f.close()
@@ -0,0 +1,14 @@
+# Generated by gen_instruction_table.py from instruction_set.py, do not edit.
+# Each tuple is indexed by opcode.
+
+instruction_names = ('nop', 'ld', 'ld', 'inc', 'inc', 'dec', 'ld', 'rlca', 'ld', 'add', 'ld', 'dec', 'inc', 'dec', 'ld', 'rrca', 'stop', 'ld', 'ld', 'inc', 'inc', 'dec', 'ld', 'rla', 'jr', 'add', 'ld', 'dec', 'inc', 'dec', 'ld', 'rra', 'jr', 'ld', 'ld', 'inc', 'inc', 'dec', 'ld', 'daa', 'jr', 'add', 'ld', 'dec', 'inc', 'dec', 'ld', 'cpl', 'jr', 'ld', 'ld', 'inc', 'inc', 'dec', 'ld', 'scf', 'jr', 'add', 'ld', 'dec', 'inc', 'dec', 'ld', 'ccf', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'halt', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'ld', 'add', 'add', 'add', 'add', 'add', 'add', 'add', 'add', 'adc', 'adc', 'adc', 'adc', 'adc', 'adc', 'adc', 'adc', 'sub', 'sub', 'sub', 'sub', 'sub', 'sub', 'sub', 'sub', 'sbc', 'sbc', 'sbc', 'sbc', 'sbc', 'sbc', 'sbc', 'sbc', 'and', 'and', 'and', 'and', 'and', 'and', 'and', 'and', 'xor', 'xor', 'xor', 'xor', 'xor', 'xor', 'xor', 'xor', 'or', 'or', 'or', 'or', 'or', 'or', 'or', 'or', 'cp', 'cp', 'cp', 'cp', 'cp', 'cp', 'cp', 'cp', 'ret', 'pop', 'jp', 'jp', 'call', 'push', 'add', 'rst', 'ret', 'ret', 'jp', 'CBPREFIX', 'call', 'call', 'adc', 'rst', 'ret', 'pop', 'jp', 'DB', 'call', 'push', 'sub', 'rst', 'ret', 'reti', 'jp', 'DB', 'call', 'DB', 'sbc', 'rst', 'ld', 'pop', 'ld', 'DB', 'DB', 'push', 'and', 'rst', 'add', 'jp', 'ld', 'DB', 'DB', 'DB', 'xor', 'rst', 'ld', 'pop', 'ld', 'di', 'DB', 'push', 'or', 'rst', 'ld', 'ld', 'ld', 'ei', 'DB', 'DB', 'cp', 'rst')
+
+instruction_operands = ((), ('bc', 'd16'), ('[bc]', 'a'), ('bc',), ('b',), ('b',), ('b', 'd8'), (), ('[a16]', 'sp'), ('hl', 'bc'), ('a', '[bc]'), ('bc',), ('c',), ('c',), ('c', 'd8'), (), (), ('de', 'd16'), ('[de]', 'a'), ('de',), ('d',), ('d',), ('d', 'd8'), (), ('pc+r8',), ('hl', 'de'), ('a', '[de]'), ('de',), ('e',), ('e',), ('e', 'd8'), (), ('nz', 'pc+r8'), ('hl', 'd16'), ('[hli]', 'a'), ('hl',), ('h',), ('h',), ('h', 'd8'), (), ('z', 'pc+r8'), ('hl', 'hl'), ('a', '[hli]'), ('hl',), ('l',), ('l',), ('l', 'd8'), (), ('nc', 'pc+r8'), ('sp', 'd16'), ('[hld]', 'a'), ('sp',), ('[hl]',), ('[hl]',), ('[hl]', 'd8'), (), ('c', 'pc+r8'), ('hl', 'sp'), ('a', '[hld]'), ('sp',), ('a',), ('a',), ('a', 'd8'), (), ('b', 'b'), ('b', 'c'), ('b', 'd'), ('b', 'e'), ('b', 'h'), ('b', 'l'), ('b', '[hl]'), ('b', 'a'), ('c', 'b'), ('c', 'c'), ('c', 'd'), ('c', 'e'), ('c', 'h'), ('c', 'l'), ('c', '[hl]'), ('c', 'a'), ('d', 'b'), ('d', 'c'), ('d', 'd'), ('d', 'e'), ('d', 'h'), ('d', 'l'), ('d', '[hl]'), ('d', 'a'), ('e', 'b'), ('e', 'c'), ('e', 'd'), ('e', 'e'), ('e', 'h'), ('e', 'l'), ('e', '[hl]'), ('e', 'a'), ('h', 'b'), ('h', 'c'), ('h', 'd'), ('h', 'e'), ('h', 'h'), ('h', 'l'), ('h', '[hl]'), ('h', 'a'), ('l', 'b'), ('l', 'c'), ('l', 'd'), ('l', 'e'), ('l', 'h'), ('l', 'l'), ('l', '[hl]'), ('l', 'a'), ('[hl]', 'b'), ('[hl]', 'c'), ('[hl]', 'd'), ('[hl]', 'e'), ('[hl]', 'h'), ('[hl]', 'l'), (), ('[hl]', 'a'), ('a', 'b'), ('a', 'c'), ('a', 'd'), ('a', 'e'), ('a', 'h'), ('a', 'l'), ('a', '[hl]'), ('a', 'a'), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('nz',), ('bc',), ('nz', 'a16'), ('a16',), ('nz', 'a16'), ('bc',), ('d8',), ('$00',), ('z',), (), ('z', 'a16'), (), ('z', 'a16'), ('a16',), ('d8',), ('$08',), ('nc',), ('de',), ('nc', 'a16'), ('$d3',), ('nc', 'a16'), ('de',), ('d8',), ('$10',), ('c',), (), ('c', 'a16'), ('$db',), ('c', 'a16'), ('$dd',), ('d8',), ('$18',), ('[$ff00+a8]', 'a'), ('hl',), ('[$ff00+c]', 'a'), ('$e3',), ('$e4',), ('hl',), ('d8',), ('$20',), ('sp', 'r8'), ('hl',), ('[a16]', 'a'), ('$eb',), ('$ec',), ('$ed',), ('d8',), ('$28',), ('a', '[$ff00+a8]'), ('af',), ('a', '[$ff00+c]'), (), ('$f4',), ('af',), ('d8',), ('$30',), ('hl', 'sp+r8'), ('sp', 'hl'), ('a', '[a16]'), (), ('$fc',), ('$fd',), ('d8',), ('$38',))
+
+cb_instruction_names = ('rlc', 'rlc', 'rlc', 'rlc', 'rlc', 'rlc', 'rlc', 'rlc', 'rrc', 'rrc', 'rrc', 'rrc', 'rrc', 'rrc', 'rrc', 'rrc', 'rl', 'rl', 'rl', 'rl', 'rl', 'rl', 'rl', 'rl', 'rr', 'rr', 'rr', 'rr', 'rr', 'rr', 'rr', 'rr', 'sla', 'sla', 'sla', 'sla', 'sla', 'sla', 'sla', 'sla', 'sra', 'sra', 'sra', 'sra', 'sra', 'sra', 'sra', 'sra', 'swap', 'swap', 'swap', 'swap', 'swap', 'swap', 'swap', 'swap', 'srl', 'srl', 'srl', 'srl', 'srl', 'srl', 'srl', 'srl', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'bit', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'res', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set', 'set')
+
+cb_instruction_operands = (('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('b',), ('c',), ('d',), ('e',), ('h',), ('l',), ('[hl]',), ('a',), ('0', 'b'), ('0', 'c'), ('0', 'd'), ('0', 'e'), ('0', 'h'), ('0', 'l'), ('0', '[hl]'), ('0', 'a'), ('1', 'b'), ('1', 'c'), ('1', 'd'), ('1', 'e'), ('1', 'h'), ('1', 'l'), ('1', '[hl]'), ('1', 'a'), ('2', 'b'), ('2', 'c'), ('2', 'd'), ('2', 'e'), ('2', 'h'), ('2', 'l'), ('2', '[hl]'), ('2', 'a'), ('3', 'b'), ('3', 'c'), ('3', 'd'), ('3', 'e'), ('3', 'h'), ('3', 'l'), ('3', '[hl]'), ('3', 'a'), ('4', 'b'), ('4', 'c'), ('4', 'd'), ('4', 'e'), ('4', 'h'), ('4', 'l'), ('4', '[hl]'), ('4', 'a'), ('5', 'b'), ('5', 'c'), ('5', 'd'), ('5', 'e'), ('5', 'h'), ('5', 'l'), ('5', '[hl]'), ('5', 'a'), ('6', 'b'), ('6', 'c'), ('6', 'd'), ('6', 'e'), ('6', 'h'), ('6', 'l'), ('6', '[hl]'), ('6', 'a'), ('7', 'b'), ('7', 'c'), ('7', 'd'), ('7', 'e'), ('7', 'h'), ('7', 'l'), ('7', '[hl]'), ('7', 'a'), ('0', 'b'), ('0', 'c'), ('0', 'd'), ('0', 'e'), ('0', 'h'), ('0', 'l'), ('0', '[hl]'), ('0', 'a'), ('1', 'b'), ('1', 'c'), ('1', 'd'), ('1', 'e'), ('1', 'h'), ('1', 'l'), ('1', '[hl]'), ('1', 'a'), ('2', 'b'), ('2', 'c'), ('2', 'd'), ('2', 'e'), ('2', 'h'), ('2', 'l'), ('2', '[hl]'), ('2', 'a'), ('3', 'b'), ('3', 'c'), ('3', 'd'), ('3', 'e'), ('3', 'h'), ('3', 'l'), ('3', '[hl]'), ('3', 'a'), ('4', 'b'), ('4', 'c'), ('4', 'd'), ('4', 'e'), ('4', 'h'), ('4', 'l'), ('4', '[hl]'), ('4', 'a'), ('5', 'b'), ('5', 'c'), ('5', 'd'), ('5', 'e'), ('5', 'h'), ('5', 'l'), ('5', '[hl]'), ('5', 'a'), ('6', 'b'), ('6', 'c'), ('6', 'd'), ('6', 'e'), ('6', 'h'), ('6', 'l'), ('6', '[hl]'), ('6', 'a'), ('7', 'b'), ('7', 'c'), ('7', 'd'), ('7', 'e'), ('7', 'h'), ('7', 'l'), ('7', '[hl]'), ('7', 'a'), ('0', 'b'), ('0', 'c'), ('0', 'd'), ('0', 'e'), ('0', 'h'), ('0', 'l'), ('0', '[hl]'), ('0', 'a'), ('1', 'b'), ('1', 'c'), ('1', 'd'), ('1', 'e'), ('1', 'h'), ('1', 'l'), ('1', '[hl]'), ('1', 'a'), ('2', 'b'), ('2', 'c'), ('2', 'd'), ('2', 'e'), ('2', 'h'), ('2', 'l'), ('2', '[hl]'), ('2', 'a'), ('3', 'b'), ('3', 'c'), ('3', 'd'), ('3', 'e'), ('3', 'h'), ('3', 'l'), ('3', '[hl]'), ('3', 'a'), ('4', 'b'), ('4', 'c'), ('4', 'd'), ('4', 'e'), ('4', 'h'), ('4', 'l'), ('4', '[hl]'), ('4', 'a'), ('5', 'b'), ('5', 'c'), ('5', 'd'), ('5', 'e'), ('5', 'h'), ('5', 'l'), ('5', '[hl]'), ('5', 'a'), ('6', 'b'), ('6', 'c'), ('6', 'd'), ('6', 'e'), ('6', 'h'), ('6', 'l'), ('6', '[hl]'), ('6', 'a'), ('7', 'b'), ('7', 'c'), ('7', 'd'), ('7', 'e'), ('7', 'h'), ('7', 'l'), ('7', '[hl]'), ('7', 'a'))
+
+# length of the instruction starting with each opcode, as bytes so it can be used as a
+# translation table. stop and halt do not include the nop rgbds adds after them
+instruction_lengths = b'\x01\x03\x01\x01\x01\x01\x02\x01\x03\x01\x01\x01\x01\x01\x02\x01\x01\x03\x01\x01\x01\x01\x02\x01\x02\x01\x01\x01\x01\x01\x02\x01\x02\x03\x01\x01\x01\x01\x02\x01\x02\x01\x01\x01\x01\x01\x02\x01\x02\x03\x01\x01\x01\x01\x02\x01\x02\x01\x01\x01\x01\x01\x02\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x03\x03\x03\x01\x02\x01\x01\x01\x03\x02\x03\x03\x02\x01\x01\x01\x03\x01\x03\x01\x02\x01\x01\x01\x03\x01\x03\x01\x02\x01\x02\x01\x01\x01\x01\x01\x02\x01\x02\x01\x03\x01\x01\x01\x02\x01\x02\x01\x01\x01\x01\x01\x02\x01\x02\x01\x03\x01\x01\x01\x02\x01'
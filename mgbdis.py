@@ -7,13 +7,13 @@ __version__ = '1.0.1'
 __copyright__ = 'Copyright 2018 by Matt Currie'
 __license__ = 'MIT'
 
-import argparse
-import glob
-import hashlib
+from array import array
+from bisect import bisect_left, bisect_right
 import os
-from shutil import copyfile
+import re
+import sys
 
-from instruction_set import instructions, cb_instructions
+import instruction_table
 
 default_symbols = [
     '00:0000 RST_00',
@@ -70,66 +70,85 @@ gbc_symbols = [
     '00:0143 .data:1'
 ]
 
-hardware_labels = {
-    0xFF00: 'rP1',
-    0xFF01: 'rSB',
-    0xFF02: 'rSC',
-    0xFF04: 'rDIV',
-    0xFF05: 'rTIMA',
-    0xFF06: 'rTMA',
-    0xFF07: 'rTAC',
-    0xFF0F: 'rIF',
-    0xFF40: 'rLCDC',
-    0xFF41: 'rSTAT',
-    0xFF42: 'rSCY',
-    0xFF43: 'rSCX',
-    0xFF44: 'rLY',
-    0xFF45: 'rLYC',
-    0xFF46: 'rDMA',
-    0xFF47: 'rBGP',
-    0xFF48: 'rOBP0',
-    0xFF49: 'rOBP1',
-    0xFF4A: 'rWY',
-    0xFF4B: 'rWX',
-    0xFF4D: 'rKEY1',
-    0xFF4F: 'rVBK',
-    0xFF51: 'rHDMA1',
-    0xFF52: 'rHDMA2',
-    0xFF53: 'rHDMA3',
-    0xFF54: 'rHDMA4',
-    0xFF55: 'rHDMA5',
-    0xFF56: 'rRP',
-    0xFF68: 'rBCPS',
-    0xFF69: 'rBCPD',
-    0xFF6A: 'rOCPS',
-    0xFF6B: 'rOCPD',
-    0xFF70: 'rSVBK',
-    0xFFFF: 'rIE',
-    0xFF24: 'rNR50',
-    0xFF25: 'rNR51',
-    0xFF26: 'rNR52',
-    0xFF10: 'rNR10',
-    0xFF11: 'rNR11',
-    0xFF12: 'rNR12',
-    0xFF13: 'rNR13',
-    0xFF14: 'rNR14',
-    0xFF16: 'rNR21',
-    0xFF17: 'rNR22',
-    0xFF18: 'rNR23',
-    0xFF19: 'rNR24',
-    0xFF1A: 'rNR30',
-    0xFF1B: 'rNR31',
-    0xFF1C: 'rNR32',
-    0xFF1D: 'rNR33',
-    0xFF1E: 'rNR34',
-    0xFF20: 'rNR41',
-    0xFF21: 'rNR42',
-    0xFF22: 'rNR43',
-    0xFF23: 'rNR44',
-}
+hardware_register_regex = re.compile(r'^(\w+)\s+EQU\s+\$([0-9a-fA-F]{4})\b')
+
+map_bank_regex = re.compile(r'^\s*(ROM0|ROMX|VRAM|SRAM|WRAM0|WRAMX|OAM|HRAM) bank #(\d+):')
+map_symbol_regex = re.compile(r'^\s+\$([0-9a-fA-F]{4}) = (\S+)')
+cdl_run_regex = re.compile(rb'c+|d+')
+fill_run_regex = re.compile(rb'\x00{8,}|\xff{8,}')
+
+# minimum length of a run of the same byte to output with REPT
+MIN_DATA_RUN_LENGTH = 32
+
+# minimum sizes for automatically detected data blocks
+MIN_FILL_RUN_LENGTH = 64
+MIN_BANK_END_FILL_RUN_LENGTH = 8
+MIN_TILE_RUN_COUNT = 4
+MIN_POINTER_TABLE_ENTRIES = 8
+
+# lowest address a pointer in bank 0 can point to, as the restart and interrupt vectors and the
+# header are not pointed to by tables, and zero padding would otherwise look like a table
+MIN_BANK0_POINTER_ADDRESS = 0x150
+
+# opcodes of jr, jp, jp hl, ret and reti without a condition, which code cannot fall through
+unconditional_jump_opcodes = [0x18, 0xc3, 0xe9, 0xc9, 0xd9]
+
+# (file, label prefix, section name, section type, start, end) of each area of ram that is labelled
+# and reserved with --ram-layout
+ram_sections = [
+    ('sram', 's', 'SRAM', 'SRAM', 0xa000, 0xc000),
+    ('wram', 'w', 'WRAM 0', 'WRAM0', 0xc000, 0xd000),
+    ('wram', 'w', 'WRAM 1', 'WRAMX', 0xd000, 0xe000),
+    ('hram', 'h', 'HRAM', 'HRAM', 0xff80, 0xffff)
+]
+
+# lowest address that ld instructions can create data labels for, to skip the restart and interrupt
+# vectors and the header, and the confidence needed for a data label. Extra instructions loading
+# the same address add up to MAX_DATA_LABEL_REFERENCE_CONFIDENCE
+MIN_DATA_LABEL_ADDRESS = 0x150
+MIN_DATA_LABEL_CONFIDENCE = 2
+MAX_DATA_LABEL_REFERENCE_CONFIDENCE = 2
+
+# minimum number of bytes in a routine to report it when it appears more than once
+MIN_DUPLICATE_ROUTINE_LENGTH = 16
+
+# number of bytes compared at a time when finding the changes from a base rom
+DIFF_BLOCK_SIZE = 0x100
+
+# file in the output directory recording the rom, options and labels the output was generated from,
+# so that --diff only reuses the output of banks that would be generated the same way
+MANIFEST_PATH = 'mgbdis.manifest'
+
+# options that do not change the output of the banks, which are left out of the manifest
+manifest_ignored_options = ['rom_path', 'output_dir', 'tar', 'overwrite', 'diff', 'duplicates', 'port_symbols', 'debug']
+
+# default minimum length of a data segment to output with INCBIN
+MIN_INCBIN_LENGTH = 256
+
+# default number of frames to run the emulator for, 10 seconds
+DEFAULT_EMULATION_FRAMES = 600
+
+# number of fixed bytes in a row that each signature must have, used to index the signatures
+SIGNATURE_ANCHOR_LENGTH = 3
+
+# minimum number of bytes in a function or data block to match when porting symbols, and the
+# maximum number of bytes in a function
+MIN_PORTED_FUNCTION_LENGTH = 8
+MIN_PORTED_BLOCK_LENGTH = 16
+MAX_PORTED_FUNCTION_LENGTH = 0x800
+
+# operands that the first pass has to decode, as they can add a label or an address in ram or rom
+decoded_operands = ['pc+r8', 'a16', '[a16]', '[$ff00+a8]', 'd16']
+
+data_run_regex = re.compile(rb'(.)\1{%d,}' % (MIN_DATA_RUN_LENGTH - 1), re.DOTALL)
+
+# code/data log flags, one byte per rom byte
+CDL_CODE = 0x01
+CDL_DATA = 0x02
 
 def abort(message):
     print(message)
+    sys.stdout.flush()
     os._exit(1)
 
 
@@ -141,8 +160,8 @@ def hex_byte(value):
     return '${:02x}'.format(value)
 
 
-def bytes_to_string(data):
-    return ' '.join(hex_byte(byte) for byte in data)
+# hex strings for the raw bytes in listing comments
+listing_hex_bytes = ['{:02x}'.format(value) for value in range(256)]
 
 
 def rom_address_to_mem_address(address):
@@ -158,14 +177,44 @@ def to_signed(value):
     return value
 
 
+class AddressBitmap:
+    """
+    A set of addresses within a 16KB bank, stored as one bit per address.
+    """
+
+    def __init__(self, base_address, size=0x4000):
+        self.base_address = base_address
+        self.size = size
+        self.bits = bytearray(size >> 3)
+
+
+    def add(self, address):
+        offset = address - self.base_address
+        self.bits[offset >> 3] |= 1 << (offset & 7)
+
+
+    def clear(self):
+        self.bits[:] = bytes(len(self.bits))
+
+
+    def __contains__(self, address):
+        offset = address - self.base_address
+        if offset < 0 or offset >= self.size:
+            return False
+        return (self.bits[offset >> 3] >> (offset & 7)) & 1 == 1
+
+
+
 class Bank:
 
-    def __init__(self, number):
+    def __init__(self, number, ram_labels):
         self.bank_number = number
         self.blocks = dict()
-        self.disassembled_addresses = set()
         self.labelled_addresses = dict()
 
+        # labels for addresses in ram, shared by all banks
+        self.ram_labels = ram_labels
+
         if number == 0:
             self.memory_base_address = 0
             self.rom_base_address = 0
@@ -173,6 +222,9 @@ class Bank:
             self.memory_base_address = 0x4000            
             self.rom_base_address = (number - 1) * 0x4000
 
+        # start address of every instruction found in the first pass
+        self.disassembled_addresses = AddressBitmap(self.memory_base_address)
+
         self.target_addresses = dict({
             'call': set(),
             'jp': set(),
@@ -182,11 +234,39 @@ class Bank:
         self.instruction_label_prefixes = dict({
             'call': 'Call',
             'jp': 'Jump',
-            'jr': 'jr'
+            'jr': 'jr',
+            'ld': 'Data'
         })
 
+        # rom address loaded into hl or de by the ld instruction at each address in the first pass,
+        # as (bank, address), and the operand label chosen by ROM.add_data_labels for each address
+        self.data_references = dict()
+        self.data_labels = dict()
+
+        # addresses in external ram, work ram and high ram that are accessed by the code in the first pass
+        self.ram_accesses = set()
+
         # each bank defaults to having a single code block
         self.add_block(self.memory_base_address, 'code', 0x4000)
+        self.default_block = self.blocks[self.memory_base_address]
+
+        # data blocks found by ROM.detect_data_blocks, which are dropped again if any code targets them
+        self.detected_blocks = dict()
+        self.blocks_before_detection = None
+
+        # decoded instructions from the last pass, if requested by an output backend
+        self.records = None
+
+        # bank that each call or jump into the switchable bank went to when emulated, by rom address
+        self.far_targets = dict()
+
+        # (start, end, name) of each function found by find_functions, and the end address of each function by start address
+        self.functions = list()
+        self.function_ends = dict()
+
+        # basic blocks of each function by start address, built by build_control_flow_graphs.
+        # each block is (start, end, successors, calls)
+        self.control_flow_graphs = dict()
 
         self.disassemble_block_range = dict({
             'code': self.process_code_in_range,
@@ -232,23 +312,388 @@ class Bank:
                 'length': end_address - start_address
             }
 
-            if next_start_address is None and (end_address != self.memory_base_address + 0x4000):
-                # no more blocks and didn't finish at the end of the block, so finish up with a code block
-                resolved_blocks[end_address] = {
-                    'type': 'code',
-                    'length': (self.memory_base_address + 0x4000) - end_address
-                }
+            if next_start_address is None:
+                # no more blocks, so fill up to the end of the bank
+                next_start_address = self.memory_base_address + 0x4000
+
+            # if there is a gap until the next block then resume any earlier block that encloses this
+            # one, otherwise fill in the gap with a code block
+            while end_address < next_start_address:
+                block_type = 'code'
+                gap_end_address = next_start_address
+
+                for enclosing_index in range(index - 1, -1, -1):
+                    enclosing_start_address = block_start_addresses[enclosing_index]
+                    enclosing_block = self.blocks[enclosing_start_address]
+                    enclosing_end_address = enclosing_start_address + enclosing_block['length']
+                    if enclosing_end_address > end_address:
+                        block_type = enclosing_block['type']
+                        gap_end_address = min(enclosing_end_address, next_start_address)
+                        break
 
-            if next_start_address is not None and end_address < next_start_address:
-                # we have another block, but there is a gap until the next block, so fill in the gap with a code block
                 resolved_blocks[end_address] = {
-                    'type': 'code',
-                    'length': next_start_address - end_address
+                    'type': block_type,
+                    'length': gap_end_address - end_address
                 }
+                end_address = gap_end_address
 
         self.blocks = resolved_blocks
 
 
+    def add_detected_blocks(self, fill_blocks, detected_blocks):
+        # padding is never a sensible jump target, so fill blocks are kept even if code targets them
+        for address, length in fill_blocks.items():
+            self.add_block(address, 'data', length)
+
+        self.resolve_blocks()
+        self.blocks_before_detection = dict(self.blocks)
+        self.detected_blocks = detected_blocks
+
+        for address, length in detected_blocks.items():
+            self.add_block(address, 'data', length)
+
+
+    def reject_detected_blocks(self, rom):
+        """
+        Drop any detected data blocks that contain a jump or call target found in the first pass, or
+        that code falls through into. Returns True if the first pass needs to be run again.
+        """
+        targets = sorted(self.target_addresses['call'] | self.target_addresses['jp'] | self.target_addresses['jr'])
+
+        rejected = list()
+        for address, length in self.detected_blocks.items():
+            index = bisect_left(targets, address)
+            if index < len(targets) and targets[index] < address + length:
+                rejected.append(address)
+            elif self.falls_through_to(rom, address):
+                rejected.append(address)
+
+        if not len(rejected):
+            return False
+
+        if debug:
+            for address in rejected:
+                print('Rejected detected data block at {}'.format(hex_word(address)))
+
+        for address in rejected:
+            del self.detected_blocks[address]
+
+        self.blocks = dict(self.blocks_before_detection)
+        for address, length in self.detected_blocks.items():
+            self.add_block(address, 'data', length)
+
+        self.disassembled_addresses.clear()
+        for instruction_name in self.target_addresses:
+            self.target_addresses[instruction_name] = set()
+        self.ram_accesses.clear()
+
+        return True
+
+
+    def falls_through_to(self, rom, address):
+        """
+        Return True if the block before the address is code that does not end with an unconditional
+        jump or return, so execution would continue at the address.
+        """
+        previous_blocks = [start for start, block in self.blocks.items() if start + block['length'] == address]
+        if not len(previous_blocks) or self.blocks[previous_blocks[0]]['type'] != 'code':
+            return False
+
+        # the last instruction of the block starts at most 3 bytes before it ends
+        for instruction_address in range(address - 1, max(address - 4, previous_blocks[0] - 1), -1):
+            if instruction_address in self.disassembled_addresses:
+                rom_address = self.rom_base_address + instruction_address
+                return not (
+                    rom.data[rom_address] in unconditional_jump_opcodes and
+                    instruction_address + rom.instruction_length_map[rom_address] == address
+                )
+
+        return True
+
+
+    def finalize_labels(self):
+        """
+        Build the label lookup tables used when rendering the bank, once all labels are known.
+        """
+        # a target in the middle of an instruction can never be output as a label
+        mid_instruction_targets = self.find_mid_instruction_targets()
+        if len(mid_instruction_targets):
+            if debug:
+                for address in mid_instruction_targets:
+                    print('Rejected target in the middle of an instruction at {}'.format(hex_word(address)))
+
+            for instruction_name in self.target_addresses:
+                self.target_addresses[instruction_name] = set(self.target_addresses[instruction_name]).difference(mid_instruction_targets)
+
+        # rendered label lines for code and for data/text addresses
+        self.code_label_lines = dict()
+        self.data_label_lines = dict()
+
+        # label for each target address, by instruction name
+        self.operand_labels = dict()
+
+        bank_end_address = self.memory_base_address + 0x4000
+
+        for address in self.labelled_addresses:
+            if address < bank_end_address:
+                self.data_label_lines[address] = self.get_labels_for_non_code_address(address)
+
+        for address in self.data_labels:
+            if address not in self.labelled_addresses:
+                self.data_label_lines[address] = [self.data_labels[address] + ':']
+
+        for instruction_name in self.target_addresses:
+            self.operand_labels[instruction_name] = dict()
+            for address in self.target_addresses[instruction_name]:
+                label = self.get_label_for_instruction_operand(instruction_name, address)
+                if label is not None:
+                    self.operand_labels[instruction_name][address] = label
+                self.code_label_lines[address] = None
+
+        # label names, for output backends that need the names rather than the rendered lines
+        self.label_names = dict()
+
+        for address in list(self.code_label_lines) + list(self.data_label_lines):
+            self.code_label_lines[address] = self.get_labels_for_address(address)
+            self.label_names[address] = self.get_label_names_for_address(address)
+
+        # sorted addresses with labels, used to split data and text ranges
+        self.data_label_addresses = sorted(self.data_label_lines)
+
+
+    def find_mid_instruction_targets(self):
+        """
+        Return the jump and call targets in code blocks that are not the start of an instruction
+        found in the first pass. These usually come from data that was disassembled as code.
+        """
+        code_blocks = [
+            (address, address + block['length'])
+            for address, block in sorted(self.blocks.items())
+            if block['type'] == 'code'
+        ]
+        code_block_starts = [start for start, end in code_blocks]
+
+        targets = set()
+        for instruction_name in self.target_addresses:
+            for address in self.target_addresses[instruction_name]:
+                if address in self.disassembled_addresses:
+                    continue
+
+                index = bisect_right(code_block_starts, address) - 1
+                if index >= 0 and address < code_blocks[index][1]:
+                    targets.add(address)
+
+        return sorted(targets)
+
+
+    def find_functions(self):
+        """
+        Find the functions in the bank, using the instruction records from the first pass.
+
+        Functions start at call targets and global labels. A function ends at the first
+        unconditional return or jump that is not skipped over by a branch within the function,
+        at the end of a code block, or at the start of the next function.
+        """
+        starts = set(address for address in self.target_addresses['call'] if address in self.disassembled_addresses)
+        starts.update(
+            address for address, label in self.labelled_addresses.items()
+            if '.' not in label and address in self.disassembled_addresses
+        )
+        starts = sorted(starts)
+
+        record_indices = dict((record[0], index) for index, record in enumerate(self.records))
+
+        self.functions = list()
+        for start_index, start in enumerate(starts):
+            if start_index < len(starts) - 1:
+                next_start = starts[start_index + 1]
+            else:
+                next_start = self.memory_base_address + 0x4000
+
+            furthest_target = start
+            end = start
+            for record in self.records[record_indices[start]:]:
+                address, length, instruction_name, operand_values, target, output_index = record
+
+                if address != end or address >= next_start:
+                    # reached the end of the code block or the next function
+                    break
+
+                end = address + length
+
+                if target is not None and address < target < next_start and target > furthest_target:
+                    furthest_target = target
+
+                if (
+                    end > furthest_target and (
+                        instruction_name == 'reti' or
+                        (instruction_name == 'ret' and len(operand_values) == 0) or
+                        (instruction_name in ['jp', 'jr'] and len(operand_values) == 1)
+                    )
+                ):
+                    break
+
+            self.functions.append((start, end, self.get_label_names_for_address(start)[0]))
+
+        self.function_ends = dict((start, end) for start, end, name in self.functions)
+
+
+    def build_control_flow_graphs(self):
+        """
+        Split each function into basic blocks, using the instruction records from the first pass.
+        """
+        record_indices = dict((record[0], index) for index, record in enumerate(self.records))
+
+        self.control_flow_graphs = dict()
+        for function_start, function_end, name in self.functions:
+            records = self.records[record_indices[function_start]:]
+            records = records[:next((index for index, record in enumerate(records) if record[0] >= function_end), len(records))]
+
+            # blocks start at the function start, at branch targets and after branches
+            leaders = set([function_start])
+            for address, length, instruction_name, operand_values, target, output_index in records:
+                if instruction_name in ['jp', 'jr', 'ret', 'reti']:
+                    leaders.add(address + length)
+                    if target is not None and function_start <= target < function_end:
+                        leaders.add(target)
+
+            blocks = list()
+            block_start = function_start
+            for index, record in enumerate(records):
+                address, length, instruction_name, operand_values, target, output_index = record
+                end = address + length
+
+                if end not in leaders and end < function_end:
+                    continue
+
+                successors = list()
+                conditional = len(operand_values) > (0 if instruction_name == 'ret' else 1)
+
+                if instruction_name in ['jp', 'jr'] and target is not None and function_start <= target < function_end:
+                    successors.append(target)
+
+                if instruction_name not in ['jp', 'jr', 'ret', 'reti'] or (instruction_name != 'reti' and conditional):
+                    if end < function_end:
+                        successors.append(end)
+
+                calls = [
+                    record[4] for record in records[bisect_left(records, (block_start,)):index + 1]
+                    if record[2] == 'call' and record[4] is not None
+                ]
+
+                blocks.append((block_start, end, tuple(successors), tuple(calls)))
+                block_start = end
+
+            self.control_flow_graphs[function_start] = blocks
+
+
+    def compact(self):
+        """
+        Release the state that is only needed while generating labels, keeping the jump and call
+        targets as sorted arrays and the disassembled addresses as a bitmap.
+        """
+        self.blocks_before_detection = None
+        self.records = None
+
+        for instruction_name in self.target_addresses:
+            self.target_addresses[instruction_name] = array('H', sorted(self.target_addresses[instruction_name]))
+
+
+    def copy_labels(self, bank):
+        """
+        Use the first pass of an identical bank instead of running it for this bank.
+        """
+        self.blocks = bank.blocks
+        self.detected_blocks = bank.detected_blocks
+        self.disassembled_addresses = bank.disassembled_addresses
+        # the other bank may already have been compacted, so make sets again for finalize_labels to
+        # look the targets up in, rather than searching the sorted arrays
+        self.target_addresses = dict(
+            (instruction_name, set(addresses)) for instruction_name, addresses in bank.target_addresses.items()
+        )
+
+        self.ram_accesses = bank.ram_accesses
+
+        # addresses in the other bank are in this bank instead
+        self.data_references = dict(
+            (address, (self.bank_number if target_bank == bank.bank_number else target_bank, target))
+            for address, (target_bank, target) in bank.data_references.items()
+        )
+
+
+    def copy_output(self, bank):
+        """
+        Use the output of an identical bank instead of disassembling this bank, changing the
+        generated labels, listing comments and binary file paths to use this bank's number.
+        """
+        label_names = dict()
+        for address, source_names in bank.label_names.items():
+            for source_name, name in zip(source_names, self.label_names[address]):
+                if source_name != name:
+                    label_names[source_name] = name
+
+        label_regex = re.compile(
+            r'(?:{0})_{1:03x}_[0-9a-f]{{4}}\b'.format('|'.join(self.instruction_label_prefixes.values()), bank.bank_number)
+        )
+
+        def replace_label(match):
+            # the match must not be the end of a longer name
+            if match.start() > 0 and (match.string[match.start() - 1].isalnum() or match.string[match.start() - 1] == '_'):
+                return match.group()
+            return label_names.get(match.group(), match.group())
+
+        # none of the lines contain a null character, so the lines can be replaced in one go
+        text = '\0'.join(bank.output[1:])
+
+        if len(label_names):
+            text = label_regex.sub(replace_label, text)
+
+        if listing:
+            text = re.sub(r'; {:02x}:(?=[0-9a-f]{{4}}  )'.format(bank.bank_number), '; {:02x}:'.format(self.bank_number), text)
+
+        if len(bank.binary_segments):
+            text = text.replace('INCBIN "bin/bank_{:03x}_'.format(bank.bank_number), 'INCBIN "bin/bank_{:03x}_'.format(self.bank_number))
+
+        self.output = [self.format_section()] + text.split('\0')
+
+        self.records = None
+        if bank.records is not None:
+            if len(label_names):
+                self.records = [
+                    (address, length, instruction_name, [label_regex.sub(replace_label, value) for value in operand_values], target, output_index)
+                    for address, length, instruction_name, operand_values, target, output_index in bank.records
+                ]
+            else:
+                self.records = bank.records
+
+        self.function_output_indices = list()
+
+        offset = self.rom_base_address - bank.rom_base_address
+        self.binary_segments = [
+            ('bin/bank_{0:03x}_{1:04x}.bin'.format(self.bank_number, rom_address_to_mem_address(start_address + offset)), start_address + offset, end_address + offset)
+            for path, start_address, end_address in bank.binary_segments
+        ]
+
+        return '\n'.join(self.output)
+
+
+    def release_output(self):
+        self.output = None
+        self.records = None
+        self.function_output_indices = list()
+        self.binary_segments = list()
+
+
+    def get_target_bank(self, target):
+        if target < 0x4000:
+            return 0
+        elif self.bank_number > 0:
+            return self.bank_number
+
+        # the bank depends on which bank is switched in
+        return None
+
+
     def get_label_for_instruction_operand(self, instruction_name, address):
         if address not in self.disassembled_addresses:
             return None
@@ -275,6 +720,22 @@ class Bank:
         return labels
 
 
+    def get_label_names_for_address(self, address):
+        if address in self.labelled_addresses:
+            return [self.labelled_addresses[address]]
+
+        names = [
+            self.format_label(instruction_name, address)
+            for instruction_name in ['call', 'jp', 'jr']
+            if address in self.target_addresses[instruction_name]
+        ]
+
+        if address in self.data_labels:
+            names.append(self.data_labels[address])
+
+        return names
+
+
     def get_labels_for_address(self, address):
         labels = list()
 
@@ -290,9 +751,32 @@ class Bank:
                 if address in self.target_addresses[instruction_name]:
                     labels.append(self.format_label(instruction_name, address) + ':')
 
+            if address in self.data_labels:
+                labels.append(self.data_labels[address] + ':')
+
         return labels
 
 
+    def get_data_label_confidence(self, address):
+        """
+        Return how likely it is that an address loaded by an ld instruction is the start of some data:
+        3 at the start of a data or text block, 2 inside a data or text block, 1 at an instruction
+        that no code jumps to, and 0 where a label could not be output or code jumps to it.
+        """
+        if any(address in self.target_addresses[instruction_name] for instruction_name in ['call', 'jp', 'jr']):
+            return 0
+
+        block_starts = sorted(self.blocks)
+        block_start = block_starts[bisect_right(block_starts, address) - 1]
+        if self.blocks[block_start]['type'] != 'code':
+            return 3 if block_start == address else 2
+
+        if address in self.disassembled_addresses:
+            return 1
+
+        return 0
+
+
     def format_label(self, instruction_name, address):
         return '{0}_{1:03x}_{2:04x}'.format(self.instruction_label_prefixes[instruction_name], self.bank_number, address)
 
@@ -303,12 +787,24 @@ class Bank:
             operands=', '.join(operands)
         )
 
-        if False: #address is not None and source_bytes is not None:
-            return '{0:<50}; {1}: {2}'.format(instruction, hex_word(address), bytes_to_string(source_bytes))
+        if address is not None and source_bytes is not None:
+            return '{0:<50}; {1:02x}:{2:04x}  {3}'.format(
+                instruction,
+                self.bank_number,
+                address,
+                ' '.join([listing_hex_bytes[byte] for byte in source_bytes])
+            )
         else:
             return '{}'.format(instruction)
 
 
+    def format_section(self):
+        if self.bank_number == 0:
+            return 'SECTION "ROM Bank ${0:03x}", ROM0[$0]'.format(self.bank_number)
+        else:
+            return 'SECTION "ROM Bank ${0:03x}", ROMX[$4000], BANK[${0:x}]'.format(self.bank_number)
+
+
     def format_data(self, data):
         return self.format_instruction('DB', data)
 
@@ -327,18 +823,21 @@ class Bank:
             self.append_output('')
 
 
-    def disassemble(self, rom, first_pass = False):
+    def disassemble(self, rom, first_pass = False, record = False):
         self.first_pass = first_pass
 
         if first_pass:
             self.resolve_blocks()
+            self.data_references = dict()
 
         self.output = list()
+        self.records = list() if record else None
+        self.function_output_indices = list()
 
-        if self.bank_number == 0:
-            self.append_output('SECTION "ROM Bank ${0:03x}", ROM0[$0]'.format(self.bank_number))
-        else:
-            self.append_output('SECTION "ROM Bank ${0:03x}", ROMX[$4000], BANK[${0:x}]'.format(self.bank_number))
+        # (path, start, end) of each data segment output with INCBIN
+        self.binary_segments = list()
+
+        self.append_output(self.format_section())
         self.append_output('')
 
         block_start_addresses = sorted(self.blocks.keys())
@@ -357,11 +856,45 @@ class Bank:
         if not self.first_pass and debug:
             print('Disassembling code in range: {} - {}'.format(hex_word(start_address), hex_word(end_address)))
 
+        if self.first_pass and self.records is None:
+            self.sweep_code_in_range(rom, start_address, end_address)
+            return
+
         self.pc = start_address
         while self.pc < end_address:
             instruction = self.disassemble_at_pc(rom, end_address)
 
 
+    def sweep_code_in_range(self, rom, start_address, end_address):
+        """
+        Find the start of every instruction in the range for the first pass. Instructions that
+        cannot add a label are skipped over using the length map rather than being decoded.
+        """
+        data = rom.data
+        instruction_length_map = rom.instruction_length_map
+        decoded_opcodes = rom.decoded_opcodes
+
+        # set the bits of the disassembled addresses directly, offset from the start of the bank in the rom
+        disassembled_bits = self.disassembled_addresses.bits
+        bank_rom_address = self.rom_base_address + self.memory_base_address
+
+        pc = start_address
+        while pc < end_address:
+            if decoded_opcodes[data[pc]]:
+                self.pc = pc
+                self.disassemble_at_pc(rom, end_address)
+                pc = self.pc
+            else:
+                length = instruction_length_map[pc]
+                if pc + length > end_address:
+                    # the instruction spans 2 blocks, so it is output as data
+                    length = 1
+
+                offset = pc - bank_rom_address
+                disassembled_bits[offset >> 3] |= 1 << (offset & 7)
+                pc += length
+
+
     def disassemble_at_pc(self, rom, end_address):
         pc = self.pc
         pc_mem_address = rom_address_to_mem_address(pc)
@@ -370,9 +903,8 @@ class Bank:
         comment = None
         operands = None
         operand_values = list()
-
-        if opcode not in instructions:
-            abort('Unhandled opcode: {} at {}'.format(hex_byte(opcode), hex_word(pc)))
+        target = None
+        ram_address = None
 
         if opcode == 0xCB:
             cb_opcode = rom.data[pc + 1]
@@ -410,6 +942,9 @@ class Bank:
                 value = rom.data[pc + 1] + rom.data[pc + 2] * 256
                 operand_values.append('[' + hex_word(value) + ']')
 
+                if value >= 0xa000:
+                    ram_address = value
+
                 # rgbds converts "ld [$ff40],a" into "ld [$ff00+40],a" automatically,
                 # so use a macro to encode it as data to ensure exact binary reproduction of the rom
                 if value >= 0xff00 and (opcode == 0xea or opcode == 0xfa):
@@ -426,9 +961,11 @@ class Bank:
                 length += 1
                 value = rom.data[pc + 1]
                 full_value = 0xff00 + value
+                ram_address = full_value
 
-                if full_value in hardware_labels:
-                    operand_values.append('[{}]'.format(hardware_labels[full_value]))
+                label = self.ram_labels.get(full_value) or rom.hardware_register_table[full_value]
+                if label is not None:
+                    operand_values.append('[{}]'.format(label))
                 else:
                     operand_values.append('[$ff00+' + hex_byte(value) + ']')
 
@@ -440,7 +977,19 @@ class Bank:
             elif operand == 'd16':
                 length += 2
                 value = rom.data[pc + 1] + rom.data[pc + 2] * 256
-                operand_values.append(hex_word(value))
+
+                if value >= 0xa000 and opcode in [0x11, 0x21]:
+                    # ld hl, d16 and ld de, d16 often load the address of some ram to access
+                    ram_address = value
+
+                label = None
+                if not self.first_pass and value < 0x8000 and pc_mem_address in self.data_references:
+                    label = rom.banks[self.data_references[pc_mem_address][0]].data_labels.get(value)
+
+                if label is not None:
+                    operand_values.append(label)
+                else:
+                    operand_values.append(hex_word(value))
 
             elif operand == 'r8':
                 length += 1
@@ -498,6 +1047,7 @@ class Bank:
 
             if instruction_name in ['jr', 'jp', 'call'] and value is not None and value < 0x8000:
                 mem_address = rom_address_to_mem_address(value)
+                target = mem_address
 
                 # dont allow switched banks to create labels in bank 0
                 if (mem_address < 0x4000 and self.bank_number == 0) or (mem_address >= 0x4000 and self.bank_number > 0):
@@ -507,14 +1057,27 @@ class Bank:
                         self.add_label(instruction_name, mem_address)
                     else:
                         # fetch the label name
-                        label = self.get_label_for_instruction_operand(instruction_name, mem_address)
+                        label = self.operand_labels[instruction_name].get(mem_address)
                         if label is not None:
                             # remove the address from operand values and use the label instead
                             operand_values.pop()
                             operand_values.append(label)
-            elif value is not None and value >= 0xc000:
-                if value in self.labelled_addresses:
-                    label = self.labelled_addresses[value]
+
+                elif not self.first_pass and pc in self.far_targets:
+                    # the emulator found the bank that is switched in
+                    label = rom.banks[self.far_targets[pc]].labelled_addresses.get(mem_address)
+                    if label is not None:
+                        operand_values.pop()
+                        operand_values.append(label)
+            elif value is not None and (value >= 0xa000 or operand == '[a16]'):
+                label = None
+                if value >= 0xa000:
+                    label = self.ram_labels.get(value)
+                # the mbc registers are in the rom area, where reads get rom data rather than the register
+                if label is None and operand == '[a16]' and (value >= 0x8000 or opcode == 0xea):
+                    label = rom.hardware_register_table[value]
+
+                if label is not None:
                     operand = operand_values.pop()
                     if operand.startswith('['):
                         new_operand = f"[{label}]"
@@ -527,6 +1090,7 @@ class Bank:
         if pc + length - 1 >= end_address:
             # must handle it as data
             length = 1
+            target = None
             instruction_name = 'DB'
             operand_values = [hex_byte(opcode)]
 
@@ -534,16 +1098,37 @@ class Bank:
 
         if self.first_pass:
             self.disassembled_addresses.add(pc_mem_address)
+
+            if ram_address is not None and args.ram_layout and instruction_name != 'DB':
+                self.ram_accesses.add(ram_address)
+
+            # ld hl, d16 and ld de, d16 often load the address of some data
+            if args.data_labels and instruction_name == 'ld' and opcode in [0x11, 0x21] and MIN_DATA_LABEL_ADDRESS <= value < 0x8000:
+                target_bank = self.get_target_bank(value)
+                if target_bank is not None:
+                    self.data_references[pc_mem_address] = (target_bank, value)
+
+            if self.records is not None:
+                self.records.append((pc_mem_address, length, instruction_name, operand_values, target, None))
         else:
-            labels = self.get_labels_for_address(pc_mem_address)
-            if len(labels):
+            if pc_mem_address in self.function_ends:
+                self.function_output_indices.append((pc_mem_address, len(self.output)))
+
+            labels = self.code_label_lines.get(pc_mem_address)
+            if labels:
                 self.append_labels_to_output(labels)
 
             if comment is not None:
                 self.append_output(comment)
 
-            instruction_bytes = rom.data[pc:pc + length]
-            self.append_output(self.format_instruction(instruction_name, operand_values, pc_mem_address, instruction_bytes))
+            if self.records is not None:
+                self.records.append((pc_mem_address, length, instruction_name, operand_values, target, len(self.output)))
+
+            if listing:
+                instruction_bytes = rom.data_view[pc:pc + length]
+                self.append_output(self.format_instruction(instruction_name, operand_values, pc_mem_address, instruction_bytes))
+            else:
+                self.append_output(self.format_instruction(instruction_name, operand_values))
 
             # add some empty lines after returns and jumps to break up the code blocks
             if instruction_name in ['ret', 'reti', 'jr', 'jp']:
@@ -561,33 +1146,67 @@ class Bank:
 
 
     def process_data_in_range(self, rom, start_address, end_address):
-        if not self.first_pass and debug:
+        if self.first_pass:
+            # data and text blocks do not create any labels
+            return
+
+        if debug:
             print('Outputting data in range: {} - {}'.format(hex_word(start_address), hex_word(end_address)))
 
-        values = list()
+        # split the range at each label
+        start_mem_address = rom_address_to_mem_address(start_address)
+        end_mem_address = start_mem_address + end_address - start_address
+        label_addresses = self.data_label_addresses[
+            bisect_right(self.data_label_addresses, start_mem_address):
+            bisect_left(self.data_label_addresses, end_mem_address)
+        ]
+
+        segment_start_address = start_address
+        for segment_end_address in [self.rom_base_address + address for address in label_addresses] + [end_address]:
+            labels = self.data_label_lines.get(rom_address_to_mem_address(segment_start_address))
+            if labels:
+                self.append_labels_to_output(labels)
 
-        for address in range(start_address, end_address):
-            mem_address = rom_address_to_mem_address(address)
+            if args.incbin is not None and segment_end_address - segment_start_address >= args.incbin:
+                self.output_binary_segment(segment_start_address, segment_end_address)
+            else:
+                self.output_data_segment(rom, segment_start_address, segment_end_address)
+            segment_start_address = segment_end_address
 
-            labels = self.get_labels_for_non_code_address(mem_address)
-            if len(labels):
-                # add any existing values to the output and reset the list
-                if len(values) > 0:
-                    self.append_output(self.format_data(values))
-                    values = list()
 
-                self.append_labels_to_output(labels)
+    def output_binary_segment(self, start_address, end_address):
+        # the bytes are written to a binary file by the output backend
+        path = 'bin/bank_{0:03x}_{1:04x}.bin'.format(self.bank_number, rom_address_to_mem_address(start_address))
+        self.binary_segments.append((path, start_address, end_address))
+        self.append_output('    INCBIN "{}"'.format(path))
+
 
-            values.append(hex_byte(rom.data[address]))
+    def output_data_segment(self, rom, start_address, end_address):
+        # long runs of the same byte are output using REPT to keep the output small
+        address = start_address
+        for match in data_run_regex.finditer(rom.data, start_address, end_address):
+            self.output_data_lines(rom, address, match.start())
+            self.append_output('    REPT {}'.format(match.end() - match.start()))
+            self.append_output('    ' + self.format_data([hex_byte(rom.data[match.start()])]))
+            self.append_output('    ENDR')
+            address = match.end()
 
-            # output max of 16 bytes per line, and ensure any remaining values are output
-            if len(values) == 16 or (address == end_address - 1 and len(values)):
-                self.append_output(self.format_data(values))
-                values = list()
+        self.output_data_lines(rom, address, end_address)
+
+
+    def output_data_lines(self, rom, start_address, end_address):
+        # output max of 16 bytes per line
+        for address in range(start_address, end_address, 16):
+            line_end_address = min(address + 16, end_address)
+            self.append_output(self.format_data([hex_byte(byte) for byte in rom.data[address:line_end_address]]))
 
 
     def process_text_in_range(self, rom, start_address, end_address):
-        if not self.first_pass and debug:
+        if self.first_pass:
+            # data and text blocks do not create any labels
+            return
+
+        if debug:
             print('Outputting text in range: {} - {}'.format(hex_word(start_address), hex_word(end_address)))
 
         values = list()
@@ -596,8 +1215,8 @@ class Bank:
         for address in range(start_address, end_address):
             mem_address = rom_address_to_mem_address(address)
 
-            labels = self.get_labels_for_non_code_address(mem_address)
-            if len(labels):
+            labels = self.data_label_lines.get(mem_address)
+            if labels:
                 # add any existing values to the output and reset the list
                 if len(text):
                     values.append('"{}"'.format(text))
@@ -626,63 +1245,229 @@ class Bank:
 
 
 
+class SignatureIndex:
+    """
+    Finds the byte patterns of known routines and data in the rom, where None in a pattern matches
+    any byte.
+
+    Each signature is indexed by its first run of SIGNATURE_ANCHOR_LENGTH fixed bytes. All of the
+    anchors are found in a single pass over the rom by one regex built from a trie of the anchors,
+    so the time taken depends on the size of the rom and not the number of signatures. Each anchor
+    that is found is then checked against the full patterns of the signatures that use it.
+    """
+
+    def __init__(self):
+        # (name, block type, length, regex) of each signature
+        self.signatures = list()
+
+        # (signature index, offset of the anchor in the pattern) for each anchor
+        self.anchors = dict()
+        self.anchor_regex = None
+
+
+    def add(self, name, block_type, pattern):
+        """
+        Add a signature, returning False if it has no anchor.
+        """
+        fixed_length = 0
+        for offset, value in enumerate(pattern):
+            fixed_length = 0 if value is None else fixed_length + 1
+            if fixed_length == SIGNATURE_ANCHOR_LENGTH:
+                anchor_offset = offset + 1 - SIGNATURE_ANCHOR_LENGTH
+                break
+        else:
+            return False
+
+        regex = re.compile(b''.join(b'.' if value is None else re.escape(bytes([value])) for value in pattern), re.DOTALL)
+        anchor = bytes(pattern[anchor_offset:anchor_offset + SIGNATURE_ANCHOR_LENGTH])
+
+        self.anchors.setdefault(anchor, list()).append((len(self.signatures), anchor_offset))
+        self.signatures.append((name, block_type, len(pattern), regex))
+        self.anchor_regex = None
+        return True
+
+
+    def build_anchor_regex(self):
+        trie = dict()
+        for anchor in self.anchors:
+            node = trie
+            for value in anchor:
+                node = node.setdefault(value, dict())
+
+        # the lookahead allows anchors to overlap
+        self.anchor_regex = re.compile(b'(?=(' + self.trie_to_regex(trie) + b'))', re.DOTALL)
+
+
+    def trie_to_regex(self, node):
+        if not any(node.values()):
+            # last byte of the anchor
+            return b'[' + b''.join(re.escape(bytes([value])) for value in sorted(node)) + b']'
+
+        return b'(?:' + b'|'.join(
+            re.escape(bytes([value])) + self.trie_to_regex(node[value]) for value in sorted(node)
+        ) + b')'
+
+
+    def find(self, data, size):
+        """
+        Yield (name, block type, length, rom address) for each match. Matches do not cross bank
+        boundaries.
+        """
+        if not len(self.anchors):
+            return
+
+        if self.anchor_regex is None:
+            self.build_anchor_regex()
+
+        for match in self.anchor_regex.finditer(data, 0, size):
+            for signature_index, anchor_offset in self.anchors[match.group(1)]:
+                name, block_type, length, regex = self.signatures[signature_index]
+
+                start = match.start() - anchor_offset
+                if start < 0:
+                    continue
+
+                bank_end = min((start // 0x4000 + 1) * 0x4000, size)
+                if regex.match(data, start, bank_end) is not None:
+                    yield name, block_type, length, start
+
+
+
 class ROM:
 
-    def __init__(self, rom_path):
+    def __init__(self, rom_path, load_symbol_files = True):
         self.script_dir = os.path.dirname(os.path.realpath(__file__))
         self.rom_path = rom_path
         self.load()
         self.split_instructions()
+        self.load_hardware_registers()
         self.has_ld_long = False
 
-        print('ROM MD5 hash:', hashlib.md5(self.data).hexdigest())
+        if debug:
+            import hashlib
+            print('ROM MD5 hash:', hashlib.md5(self.data).hexdigest())
 
         # add some bytes to avoid an index out of range error
         # when processing last few instructions in the rom
         self.data += b'\x00\x00'
+        self.data_view = memoryview(self.data)
+
+        # length of the instruction that would start at each address
+        self.instruction_length_map = self.data.translate(self.instruction_lengths)
 
+        self.ram_labels = dict()
         self.banks = dict()
+
+        # earlier bank that each bank is identical to, found by find_duplicate_banks
+        self.duplicate_banks = dict()
         for bank in range(0, self.num_banks):
-            self.banks[bank] = Bank(bank)
+            self.banks[bank] = Bank(bank, self.ram_labels)
 
-        self.init_symbols()
+        if load_symbol_files:
+            self.init_symbols()
 
 
     def load(self):
-        if os.path.isfile(self.rom_path):
+        if self.rom_path == '-':
+            print('Loading ROM from stdin...')
+            self.data = sys.stdin.buffer.read()
+        elif os.path.isfile(self.rom_path):
             print('Loading "{}"...'.format(self.rom_path))
             self.data = open(self.rom_path, 'rb').read()  
-            self.rom_size = len(self.data)
-            self.num_banks = self.rom_size // 0x4000
         else:
             abort('"{}" not found'.format(self.rom_path))
 
+        self.rom_size = len(self.data)
+        self.num_banks = self.rom_size // 0x4000
 
-    def split_instructions(self):
-        # split the instructions and operands
-        self.instruction_names = dict()
-        self.instruction_operands = dict()
-        self.cb_instruction_name = dict()
-        self.cb_instruction_operands = dict()
-
-        for opcode in instructions:
-            instruction_parts = instructions[opcode].split()
-            self.instruction_names[opcode] = instruction_parts[0]
-            if len(instruction_parts) > 1:
-                self.instruction_operands[opcode] = instruction_parts[1].split(',')
-            else:
-                self.instruction_operands[opcode] = list()
 
-        for cb_opcode in cb_instructions:
-            instruction_parts = cb_instructions[cb_opcode].split()
-            self.cb_instruction_name[cb_opcode] = instruction_parts[0]
-            if len(instruction_parts) > 1:
-                self.cb_instruction_operands[cb_opcode] = instruction_parts[1].split(',')
-            else:
-                self.cb_instruction_operands[cb_opcode] = list()
+    def load_hardware_registers(self):
+        """
+        Load the register names defined in hardware.inc into a table with an entry for every address.
+        The names are cached in a pickle file, which is rebuilt whenever hardware.inc changes.
+        """
+        path = os.path.join(self.script_dir, 'hardware.inc')
+        cache_path = os.path.join(self.script_dir, '__pycache__', 'hardware.inc.pickle')
+        stat = os.stat(path)
+        cache_key = (stat.st_mtime_ns, stat.st_size, __version__)
+
+        import pickle
+
+        self.hardware_registers = None
+        try:
+            f = open(cache_path, 'rb')
+            key, registers = pickle.load(f)
+            f.close()
+            if key == cache_key:
+                self.hardware_registers = registers
+        except (OSError, pickle.PickleError, EOFError, ValueError, TypeError):
+            pass
+
+        if self.hardware_registers is None:
+            self.hardware_registers = self.parse_hardware_registers(path)
+
+            try:
+                if not os.path.isdir(os.path.dirname(cache_path)):
+                    os.makedirs(os.path.dirname(cache_path))
+                f = open(cache_path, 'wb')
+                pickle.dump((cache_key, self.hardware_registers), f)
+                f.close()
+            except OSError:
+                pass
+
+        self.hardware_register_table = [None] * 0x10000
+        for address, name in self.hardware_registers.items():
+            self.hardware_register_table[address] = name
+
+
+    def parse_hardware_registers(self, path):
+        registers = dict()
+
+        f = open(path, 'r')
+        for line in f:
+            match = hardware_register_regex.match(line)
+            if match is not None:
+                name, address = match.group(1), int(match.group(2), 16)
+
+                if name in ['_RAM', '_SRAM', '_HRAM']:
+                    # the start of general purpose ram is usually a variable
+                    continue
+
+                # prefer register names over memory area names at the same address, like rP1 over _HW
+                if address not in registers or (name[0] == 'r' and registers[address][0] != 'r'):
+                    registers[address] = name
+        f.close()
+
+        return registers
+
+
+    def split_instructions(self):
+        # the instructions and operands are split ahead of time by gen_instruction_table.py
+        self.instruction_names = instruction_table.instruction_names
+        self.instruction_operands = instruction_table.instruction_operands
+        self.cb_instruction_name = instruction_table.cb_instruction_names
+        self.cb_instruction_operands = instruction_table.cb_instruction_operands
+        self.instruction_lengths = instruction_table.instruction_lengths
+
+        # the first pass only decodes instructions with these opcodes, and skips over the rest using
+        # their length. stop and halt are decoded as their length depends on the next byte
+        self.decoded_opcodes = bytes(
+            name in ['stop', 'halt'] or any(operand in decoded_operands for operand in operands)
+            for name, operands in zip(self.instruction_names, self.instruction_operands)
+        )
 
 
     def init_symbols(self):
+        cdl = None
+        if args.cdl is not None:
+            cdl = self.load_cdl(args.cdl)
+
+        if args.emulate is not None:
+            cdl = self.emulate(args.emulate, cdl)
+
+        if cdl is not None:
+            self.add_code_data_log_blocks(cdl)
+
         for symbol_def in default_symbols:
             self.add_symbol_definition(symbol_def)
 
@@ -690,8 +1475,24 @@ class ROM:
             for symbol_def in gbc_symbols:
                 self.add_symbol_definition(symbol_def)
 
+        # the last label loaded for an address is used, so symbol files are loaded after map files
+        # to take priority over them
+        self.load_map_file()
+
+        for filepath in args.map:
+            self.load_map(filepath)
+
         self.load_sym_file()
 
+        for filepath in args.sym:
+            self.load_symbols(filepath)
+
+        if len(args.signatures):
+            self.match_signatures()
+
+        if args.detect_data:
+            self.detect_data_blocks()
+
 
     def add_symbol_definition(self, symbol_def):
         try:
@@ -708,7 +1509,10 @@ class ROM:
                 block_type = label_parts[0].lower()
                 data_length = int(label_parts[1], 16)
 
-                if block_type in ['.byt', '.data']:
+                if bank not in self.banks:
+                    print("Ignored symbol definition for missing bank: {}\n".format(symbol_def))
+
+                elif block_type in ['.byt', '.data']:
                     self.banks[bank].add_block(address, 'data', data_length)
 
                 elif block_type in ['.asc', '.text']:
@@ -718,13 +1522,14 @@ class ROM:
                     self.banks[bank].add_block(address, 'code', data_length)
 
             else:
-                # add the label
-                if address >= 0x8000: # RAM
-                    # slow hack
-                    for b in self.banks:
-                        self.banks[b].labelled_addresses[address] = label
-                else:
-                    self.banks[bank].labelled_addresses[address] = label
+                self.add_symbol(bank, address, label)
+
+
+    def add_symbol(self, bank, address, label):
+        if address >= 0x8000: # RAM
+            self.ram_labels[address] = label
+        elif bank in self.banks:
+            self.banks[bank].labelled_addresses[address] = label
 
 
     def supports_gbc(self):
@@ -735,97 +1540,1487 @@ class ROM:
         filepath = os.path.splitext(self.rom_path)[0] + '.sym'
 
         if os.path.isfile(filepath):
-            print('Processing symbol file "{}"...'.format(filepath))
+            self.load_symbols(filepath)
 
-            f = open(filepath, 'r')
 
-            for line in f:
-                # ignore comments and empty lines
-                if line[0] != ';' and len(line.strip()):
-                    self.add_symbol_definition(line)
+    def load_map_file(self):
+        filepath = os.path.splitext(self.rom_path)[0] + '.map'
 
-            f.close()
+        if os.path.isfile(filepath):
+            self.load_map(filepath)
 
 
-    def disassemble(self, output_dir):
+    def load_symbols(self, filepath):
+        """
+        Load a symbol file in the "BB:AAAA Label" format.
 
-        self.output_directory = os.path.abspath(output_dir.rstrip(os.sep))
+        This covers RGBDS (rgblink -n), BGB, SameBoy and no$gmb symbol files, as well as
+        Emulicious/WLA-DX style files where the labels are in a "[labels]" section.
+        """
+        if not os.path.isfile(filepath):
+            abort('Symbol file "{}" not found'.format(filepath))
 
-        if os.path.exists(self.output_directory):
-            if not args.overwrite:
-                abort('Output directory "{}" already exists!'.format(self.output_directory))
+        print('Processing symbol file "{}"...'.format(filepath))
 
-            if not os.path.isdir:
-                abort('Output path "{}" already exists and is not a directory!'.format(self.output_directory))
-        else:
-            os.makedirs(self.output_directory)
+        f = open(filepath, 'r')
 
+        section = None
+        for line in f:
+            # strip comments and ignore empty lines
+            line = line.split(';', 1)[0].strip()
+            if not len(line):
+                continue
 
-        print('Generating labels...')
-        self.generate_labels()
+            if line[0] == '[' and line[-1] == ']':
+                # WLA-DX style section header
+                section = line[1:-1].lower()
+                continue
 
-        print('Generating disassembly', end='')
-        if debug:
-            print('')
+            if section is None or section == 'labels':
+                self.add_symbol_definition(line)
 
-        for bank in range(0, self.num_banks):
-            self.write_bank_asm(bank)
+        f.close()
 
-        self.copy_hardware_inc()
-        self.write_game_asm()
-        self.write_makefile()
 
-        print('\nDisassembly generated in "{}"'.format(self.output_directory))
+    def load_signatures(self, filepath, index):
+        """
+        Load a signature file into the signature index. Each line has a label, an optional block
+        type (.code, .data or .text) and the bytes to match in hexadecimal, with ?? for bytes that
+        can have any value:
 
-        
-    def generate_labels(self):
-        for bank in range(0, self.num_banks):
-            self.banks[bank].disassemble(rom, True)
+            MemCopy .code 2a 12 13 0b 78 b1 20 f9 c9
+            SetBank ea ?? 20 c9
+        """
+        if not os.path.isfile(filepath):
+            abort('Signature file "{}" not found'.format(filepath))
 
+        print('Processing signature file "{}"...'.format(filepath))
 
-    def write_bank_asm(self, bank):
-        if not debug:
-            # progress indicator
-            print('.', end='', flush=True)
+        f = open(filepath, 'r')
 
-        path = os.path.join(self.output_directory, 'bank_{0:03x}.asm'.format(bank))
-        f = open(path, 'w')
+        for line in f:
+            # strip comments and ignore empty lines
+            line = line.split(';', 1)[0].strip()
+            if not len(line):
+                continue
 
-        self.write_header(f)
-        f.write(self.banks[bank].disassemble(rom))
+            parts = line.split()
+            name = parts[0]
+            block_type = None
+            if len(parts) > 1 and parts[1][0] == '.':
+                block_type = parts.pop(1)[1:].lower()
 
-        f.close()        
+            try:
+                if block_type not in [None, 'code', 'data', 'text']:
+                    raise ValueError
+                pattern = [None if value == '??' else int(value, 16) for value in parts[1:]]
+                if not len(pattern) or any(value is not None and not 0 <= value <= 0xff for value in pattern):
+                    raise ValueError
+            except ValueError:
+                print('Ignored invalid signature: {}\n'.format(line))
+                continue
 
+            if not index.add(name, block_type, pattern):
+                print('Ignored signature without {} fixed bytes in a row: {}\n'.format(SIGNATURE_ANCHOR_LENGTH, line))
 
-    def write_header(self, f):
-        f.write('; Disassembly of "{}"\n'.format(os.path.basename(self.rom_path)))
-        f.write('; This file was created with {}\n'.format(app_name))
-        f.write('; https://github.com/mattcurrie/mgbdis\n\n')
+        f.close()
 
 
-    def copy_hardware_inc(self):
-        src = os.path.join(self.script_dir, 'hardware.inc')
-        dest = os.path.join(self.output_directory, 'hardware.inc')
-        copyfile(src, dest)
+    def match_signatures(self):
+        """
+        Label the known routines and data found by the signature files, and create blocks for
+        them. Labels and blocks from symbol files take priority.
+        """
+        index = SignatureIndex()
+        for filepath in args.signatures:
+            self.load_signatures(filepath, index)
 
+        print('Matching signatures...')
 
-    def write_game_asm(self):
-        path = os.path.join(self.output_directory, 'game.asm')
-        f = open(path, 'w')        
+        # mark the bytes covered by each match, so matches cannot overlap
+        matched = bytearray(self.rom_size)
 
-        self.write_header(f)
+        match_counts = dict()
+        for name, block_type, length, rom_address in index.find(self.data, self.rom_size):
+            bank = self.banks[rom_address // 0x4000]
+            address = rom_address_to_mem_address(rom_address)
+            if address in bank.labelled_addresses or matched.find(1, rom_address, rom_address + length) != -1:
+                continue
 
-        if self.has_ld_long:
+            matched[rom_address:rom_address + length] = b'\x01' * length
 
-            f.write(
-"""ld_long: MACRO
-    IF STRLWR("\\1") == "a" 
-        ; ld a, [$ff40]
-        db $FA
-        dw \\2
-    ELSE 
-        IF STRLWR("\\2") == "a" 
-            ; ld [$ff40], a
+            # later matches of the same signature get a number to keep the labels unique
+            match_counts[name] = match_counts.get(name, 0) + 1
+            if match_counts[name] > 1:
+                name = '{}_{}'.format(name, match_counts[name])
+
+            bank.labelled_addresses[address] = name
+
+            if block_type is not None and address not in bank.blocks:
+                bank.add_block(address, block_type, length)
+
+            if debug:
+                print('Matched {} at {:03x}:{:04x}'.format(name, bank.bank_number, address))
+
+        print('Matched {} signatures at {} addresses'.format(len(match_counts), sum(match_counts.values())))
+
+
+    def fingerprint_function(self, rom_address, end_address):
+        """
+        Return the bytes of the function at the rom address as a signature pattern, with the
+        bytes of 16 bit operands set to None as they change when code moves, and the offsets of
+        those operands within the function.
+        """
+        data = self.data
+        pattern = list()
+        word_offsets = list()
+        furthest_target = rom_address
+        end_address = min(end_address, rom_address + MAX_PORTED_FUNCTION_LENGTH)
+
+        pc = rom_address
+        while pc < end_address:
+            opcode = data[pc]
+            instruction_name = self.instruction_names[opcode]
+            if instruction_name == 'DB':
+                break
+
+            if opcode == 0xcb:
+                operands = tuple()
+            else:
+                operands = self.instruction_operands[opcode]
+            length = self.instruction_lengths[opcode]
+
+            if pc + length > end_address:
+                break
+
+            pattern.extend(data[pc:pc + length])
+
+            target = None
+            if len(operands) and operands[-1] in ['a16', '[a16]', 'd16'] or operands[:1] == ('[a16]',):
+                word_offsets.append(pc + 1 - rom_address)
+                pattern[-2:] = [None, None]
+                if instruction_name in ['jp', 'call']:
+                    target = (pc // 0x4000) * 0x4000 + (data[pc + 1] + data[pc + 2] * 256) % 0x4000
+            elif len(operands) and operands[-1] == 'pc+r8':
+                target = pc + 2 + to_signed(data[pc + 1])
+
+            if target is not None and pc < target < end_address and target > furthest_target:
+                furthest_target = target
+
+            pc += length
+
+            if (
+                pc > furthest_target and (
+                    instruction_name == 'reti' or
+                    (instruction_name == 'ret' and len(operands) == 0) or
+                    (instruction_name in ['jp', 'jr'] and len(operands) == 1)
+                )
+            ):
+                break
+
+        return pattern, word_offsets
+
+
+    def port_symbols(self, old_rom_path, old_symbols_path):
+        """
+        Write a symbol file for this rom from the symbol file of another version of the rom.
+
+        Each labelled function in the old rom is matched against this rom with its 16 bit operands
+        masked, using a single pass of a signature index. Labels within matched functions keep
+        their offset from the start of the function, labels used by the operands of matched
+        functions move to the operand values in this rom, and data blocks are matched by their
+        contents.
+        """
+        if self.rom_path == '-':
+            abort('Symbols cannot be ported to a rom read from stdin')
+
+        symbols_path = os.path.splitext(self.rom_path)[0] + '.sym'
+        if os.path.exists(symbols_path) and not args.overwrite:
+            abort('Symbol file "{}" already exists!'.format(symbols_path))
+
+        old_rom = ROM(old_rom_path, load_symbol_files = False)
+        old_rom.load_symbols(old_symbols_path)
+
+        print('Porting symbols...')
+
+        # labels and blocks for this rom, keyed by (bank, address)
+        ported = dict()
+        blocks = dict()
+        label_count = len(old_rom.ram_labels) + sum(len(bank.labelled_addresses) for bank in old_rom.banks.values())
+
+        # index the labelled functions of the old rom
+        index = SignatureIndex()
+        functions = dict()
+        for bank in old_rom.banks.values():
+            non_code_blocks = [
+                (address, address + block['length']) for address, block in bank.blocks.items() if block['type'] != 'code'
+            ]
+            starts = sorted(
+                address for address, label in bank.labelled_addresses.items()
+                if '.' not in label and not any(start <= address < end for start, end in non_code_blocks)
+            )
+
+            for start_index, start in enumerate(starts):
+                if start_index < len(starts) - 1:
+                    end = starts[start_index + 1]
+                else:
+                    end = bank.memory_base_address + 0x4000
+
+                for block_start, block_end in non_code_blocks:
+                    if start < block_start < end:
+                        end = block_start
+
+                pattern, word_offsets = old_rom.fingerprint_function(
+                    bank.rom_base_address + start, bank.rom_base_address + end
+                )
+                if len(pattern) >= MIN_PORTED_FUNCTION_LENGTH and index.add((bank.bank_number, start), None, pattern):
+                    functions[(bank.bank_number, start)] = (len(pattern), word_offsets)
+
+        matches = dict()
+        for key, block_type, length, rom_address in index.find(self.data, self.rom_size):
+            matches.setdefault(key, list()).append(rom_address)
+
+        # votes for the new address of each labelled address used by an operand
+        operand_votes = dict()
+
+        matched_functions = 0
+        ambiguous_functions = 0
+        for (bank_number, start), rom_addresses in matches.items():
+            if len(rom_addresses) > 1:
+                # prefer a match in the same bank
+                rom_addresses = [rom_address for rom_address in rom_addresses if rom_address // 0x4000 == bank_number]
+                if len(rom_addresses) != 1:
+                    ambiguous_functions += 1
+                    continue
+
+            matched_functions += 1
+            old_bank = old_rom.banks[bank_number]
+            old_rom_address = old_bank.rom_base_address + start
+            new_rom_address = rom_addresses[0]
+            new_bank_number = new_rom_address // 0x4000
+            new_start = rom_address_to_mem_address(new_rom_address)
+            length, word_offsets = functions[(bank_number, start)]
+
+            # labels within the function keep their offset from the start
+            for offset in range(length):
+                if start + offset in old_bank.labelled_addresses:
+                    ported[(new_bank_number, new_start + offset)] = old_bank.labelled_addresses[start + offset]
+
+            for offset in word_offsets:
+                old_value = old_rom.data[old_rom_address + offset] + old_rom.data[old_rom_address + offset + 1] * 256
+                new_value = self.data[new_rom_address + offset] + self.data[new_rom_address + offset + 1] * 256
+
+                if old_value >= 0x8000:
+                    key = (None, old_value)
+                    new_key = (None, new_value)
+                elif old_value < 0x4000:
+                    key = (0, old_value)
+                    new_key = (0, new_value)
+                elif bank_number > 0 and new_bank_number > 0:
+                    # only addresses in the same switchable bank as the function are known
+                    key = (bank_number, old_value)
+                    new_key = (new_bank_number, new_value)
+                else:
+                    continue
+
+                votes = operand_votes.setdefault(key, dict())
+                votes[new_key] = votes.get(new_key, 0) + 1
+
+        # data and text blocks are matched by their contents
+        for bank in old_rom.banks.values():
+            for address, block in bank.blocks.items():
+                if block['type'] == 'code' or block['length'] < MIN_PORTED_BLOCK_LENGTH:
+                    continue
+
+                old_rom_address = bank.rom_base_address + address
+                contents = bytes(old_rom.data[old_rom_address:old_rom_address + block['length']])
+                rom_addresses = list()
+                rom_address = self.data.find(contents)
+                while rom_address != -1:
+                    rom_addresses.append(rom_address)
+                    rom_address = self.data.find(contents, rom_address + 1)
+
+                if len(rom_addresses) > 1:
+                    # prefer a match in the same bank
+                    rom_addresses = [rom_address for rom_address in rom_addresses if rom_address // 0x4000 == bank.bank_number]
+                if len(rom_addresses) != 1:
+                    continue
+
+                new_rom_address = rom_addresses[0]
+                new_bank_number = new_rom_address // 0x4000
+                new_address = rom_address_to_mem_address(new_rom_address)
+                if (new_rom_address + block['length'] - 1) // 0x4000 != new_bank_number:
+                    continue
+
+                blocks[(new_bank_number, new_address)] = (block['type'], block['length'])
+                for offset in range(block['length']):
+                    if address + offset in bank.labelled_addresses:
+                        ported.setdefault((new_bank_number, new_address + offset), bank.labelled_addresses[address + offset])
+
+        # labels used by operands move to the address they were most often mapped to
+        ported_labels = set(ported.values())
+        for (bank_number, old_value), votes in operand_votes.items():
+            if bank_number is None:
+                label = old_rom.ram_labels.get(old_value)
+            else:
+                label = old_rom.banks[bank_number].labelled_addresses.get(old_value)
+
+            if label is None or label in ported_labels:
+                continue
+
+            new_bank_number, new_value = max(votes, key=votes.get)
+            ported[(new_bank_number or 0, new_value)] = label
+            ported_labels.add(label)
+
+        # ram labels that are not used by any matched function stay at the same address
+        kept_ram_labels = 0
+        for address, label in old_rom.ram_labels.items():
+            if label not in ported_labels:
+                ported[(0, address)] = label
+                ported_labels.add(label)
+                kept_ram_labels += 1
+
+        f = open(symbols_path, 'w')
+        f.write('; Ported from {} by {}\n'.format(os.path.basename(old_symbols_path), app_name))
+
+        for bank_number, address in sorted(set(ported) | set(blocks)):
+            if (bank_number, address) in ported:
+                f.write('{0:02x}:{1:04x} {2}\n'.format(bank_number, address, ported[(bank_number, address)]))
+            if (bank_number, address) in blocks:
+                block_type, length = blocks[(bank_number, address)]
+                f.write('{0:02x}:{1:04x} .{2}:{3:x}\n'.format(bank_number, address, block_type, length))
+
+        f.close()
+
+        print('Matched {} of {} functions ({} ambiguous) and {} data blocks'.format(
+            matched_functions, len(functions), ambiguous_functions, len(blocks)
+        ))
+        print('Ported {} of {} labels, {} unused ram labels were kept at the same address'.format(
+            len(ported), label_count, kept_ram_labels
+        ))
+        print('Symbols written to {}'.format(symbols_path))
+
+
+    def load_cdl(self, filepath):
+        """
+        Load a code/data log, which has one byte of flags for each byte in the rom: bit 0 is set
+        if the byte was executed and bit 1 if it was read as data.
+        """
+        if not os.path.isfile(filepath):
+            abort('Code/data log "{}" not found'.format(filepath))
+
+        print('Processing code/data log "{}"...'.format(filepath))
+
+        f = open(filepath, 'rb')
+        cdl = f.read()
+        f.close()
+
+        if cdl[:5] == b'CDLv2':
+            # skip the Mesen header (magic and crc32 of the rom)
+            cdl = cdl[9:]
+
+        if len(cdl) != self.rom_size:
+            print('Warning: code/data log size does not match the rom size')
+            cdl = cdl[:self.rom_size].ljust(self.rom_size, b'\x00')
+
+        return cdl
+
+
+    def emulate(self, frames, cdl):
+        """
+        Run the rom in the emulator and return the code/data log it records, merged with the
+        given code/data log. Calls and jumps from bank 0 into the switchable bank that always went
+        to the same bank are labelled.
+        """
+        import emulator
+
+        print('Emulating {} frames...'.format(frames))
+
+        emu = emulator.Emulator(self.data[:self.rom_size], self.supports_gbc())
+        emu.run(frames)
+
+        if emu.stopped_at is not None:
+            print('Emulation stopped at illegal instruction at {}'.format(hex_word(emu.stopped_at)))
+        print('Executed {} instructions, switching between {} banks'.format(emu.instruction_count, len(emu.switched_banks)))
+
+        for source, targets in emu.far_jumps.items():
+            if len(targets) != 1:
+                continue
+
+            target = next(iter(targets))
+            bank = self.banks.get(target // 0x4000)
+            if bank is None:
+                continue
+
+            address = rom_address_to_mem_address(target)
+            if address not in bank.labelled_addresses:
+                instruction_name = 'jp' if self.instruction_names[self.data[source]] == 'jp' else 'call'
+                bank.labelled_addresses[address] = bank.format_label(instruction_name, address)
+
+            self.banks[0].far_targets[source] = bank.bank_number
+
+        emulated = emu.get_code_data_log(self.rom_size)
+        if cdl is None:
+            return emulated
+
+        return (int.from_bytes(cdl, 'big') | int.from_bytes(emulated, 'big')).to_bytes(self.rom_size, 'big')
+
+
+    def add_code_data_log_blocks(self, cdl):
+        """
+        Create code and data blocks from a code/data log. Bytes that were never accessed are
+        treated as --cdl-unknown blocks.
+        """
+        # classify every byte in a single pass, unknown bytes take on the configured block type
+        unknown = b'c' if args.cdl_unknown == 'code' else b'd'
+        table = bytes(
+            ord('c') if flags & CDL_CODE else ord('d') if flags & CDL_DATA else unknown[0]
+            for flags in range(256)
+        )
+        classes = cdl.translate(table)
+        executed = cdl.translate(bytes(ord('c') if flags & CDL_CODE else 0 for flags in range(256)))
+        accessed = cdl.translate(bytes(ord('d') if flags & (CDL_CODE | CDL_DATA) else 0 for flags in range(256)))
+
+        for bank_number in range(0, self.num_banks):
+            bank = self.banks[bank_number]
+            start = bank_number * 0x4000
+            end = start + 0x4000
+
+            # convert each run of the same type of byte into a block
+            for match in cdl_run_regex.finditer(classes, start, end):
+                block_type = 'code' if match.group()[0] == ord('c') else 'data'
+                address = bank.memory_base_address + match.start() - start
+                bank.add_block(address, block_type, match.end() - match.start())
+
+            code_bytes = executed.count(b'c', start, end)
+            accessed_bytes = accessed.count(b'd', start, end)
+            print('Bank ${0:03x}: {1:5.1f}% code, {2:5.1f}% data, {3:5.1f}% unknown'.format(
+                bank_number,
+                100 * code_bytes / 0x4000,
+                100 * (accessed_bytes - code_bytes) / 0x4000,
+                100 * (0x4000 - accessed_bytes) / 0x4000
+            ))
+
+
+    def detect_data_blocks(self):
+        """
+        Find padding, tile graphics and pointer tables in the parts of each bank that have not
+        been assigned a block type, and mark them as data before disassembling.
+        """
+        print('Detecting data blocks...')
+
+        for bank_number in range(0, self.num_banks):
+            bank = self.banks[bank_number]
+            bank_data = self.data[bank_number * 0x4000:(bank_number + 1) * 0x4000]
+
+            # mark the bytes covered by blocks from symbol files and code/data logs, these are left alone
+            assigned = bytearray(0x4000)
+            for address, block in bank.blocks.items():
+                if block is not bank.default_block:
+                    start = max(address - bank.memory_base_address, 0)
+                    end = min(address - bank.memory_base_address + block['length'], 0x4000)
+                    if start < end:
+                        assigned[start:end] = b'\x01' * (end - start)
+
+            fill_blocks = dict()
+            detected_blocks = dict()
+            for blocks, runs in [
+                (fill_blocks, self.find_fill_runs(bank_data)),
+                (detected_blocks, self.find_pointer_tables(bank_data, bank.memory_base_address)),
+                (detected_blocks, self.find_tile_runs(bank_data))
+            ]:
+                for start, end in runs:
+                    if assigned.find(1, start, end) == -1:
+                        assigned[start:end] = b'\x01' * (end - start)
+                        blocks[bank.memory_base_address + start] = end - start
+
+            if debug:
+                print('Bank ${0:03x}: detected {1} padding bytes and {2} other data bytes'.format(
+                    bank_number, sum(fill_blocks.values()), sum(detected_blocks.values())
+                ))
+
+            bank.add_detected_blocks(fill_blocks, detected_blocks)
+
+
+    def find_fill_runs(self, bank_data):
+        runs = list()
+
+        for match in fill_run_regex.finditer(bank_data):
+            length = match.end() - match.start()
+            if length >= MIN_FILL_RUN_LENGTH or (match.end() == len(bank_data) and length >= MIN_BANK_END_FILL_RUN_LENGTH):
+                runs.append((match.start(), match.end()))
+
+        return runs
+
+
+    def find_tile_runs(self, bank_data):
+        """
+        Find runs of 16 byte aligned chunks that look like 2bpp tiles. In tile graphics most rows
+        have both bitplanes equal, or one of them empty or full, which is rare in code.
+        """
+        low_planes = bank_data[0::2]
+        high_planes = bank_data[1::2]
+
+        runs = list()
+        run_start = None
+
+        for tile in range(0, len(bank_data) // 16):
+            tile_rows = 0
+            for row in range(tile * 8, tile * 8 + 8):
+                low = low_planes[row]
+                high = high_planes[row]
+                if low == high or low == 0 or high == 0 or low == 0xff or high == 0xff:
+                    tile_rows += 1
+
+            tile_data = bank_data[tile * 16:tile * 16 + 16]
+            is_tile = tile_rows >= 7 and tile_data.count(tile_data[0]) != 16
+
+            if is_tile and run_start is None:
+                run_start = tile
+            elif not is_tile and run_start is not None:
+                if tile - run_start >= MIN_TILE_RUN_COUNT:
+                    runs.append((run_start * 16, tile * 16))
+                run_start = None
+
+        if run_start is not None and len(bank_data) // 16 - run_start >= MIN_TILE_RUN_COUNT:
+            runs.append((run_start * 16, len(bank_data) // 16 * 16))
+
+        return runs
+
+
+    def find_pointer_tables(self, bank_data, memory_base_address):
+        """
+        Find runs of little endian words that all point into this bank, outside of the table itself.
+        """
+        runs = list()
+
+        min_pointer = max(memory_base_address, MIN_BANK0_POINTER_ADDRESS)
+        max_pointer = memory_base_address + 0x4000
+
+        for offset in [0, 1]:
+            words = [low | (high << 8) for low, high in zip(bank_data[offset::2], bank_data[offset + 1::2])]
+            words.append(None)
+
+            run_start = None
+            for index, word in enumerate(words):
+                if word is not None and min_pointer <= word < max_pointer:
+                    if run_start is None:
+                        run_start = index
+                    continue
+
+                if run_start is not None and index - run_start >= MIN_POINTER_TABLE_ENTRIES:
+                    table_start = memory_base_address + offset + run_start * 2
+                    table_end = memory_base_address + offset + index * 2
+                    table = words[run_start:index]
+
+                    # sequences of "ld r, r" instructions also look like pointers into $4000-$7fff
+                    ld_like = sum(1 for pointer in table if 0x40 <= (pointer & 0xff) < 0x80)
+
+                    # words made of the same byte twice that appear more than once are fill, like $4040
+                    fill_words = [pointer for pointer in set(table) if pointer & 0xff == pointer >> 8 and table.count(pointer) > 1]
+
+                    if (
+                        len(set(table)) >= MIN_POINTER_TABLE_ENTRIES // 2 and
+                        ld_like * 2 <= len(table) and
+                        not len(fill_words) and
+                        not any(table_start <= pointer < table_end for pointer in table)
+                    ):
+                        runs.append((offset + run_start * 2, offset + index * 2))
+
+                run_start = None
+
+        return runs
+
+
+    def load_map(self, filepath):
+        """
+        Load the labels from a map file created by rgblink (-m).
+        """
+        if not os.path.isfile(filepath):
+            abort('Map file "{}" not found'.format(filepath))
+
+        print('Processing map file "{}"...'.format(filepath))
+
+        f = open(filepath, 'r')
+
+        bank = None
+        for line in f:
+            match = map_bank_regex.match(line)
+            if match is not None:
+                region, bank = match.group(1), int(match.group(2))
+                if region not in ['ROM0', 'ROMX']:
+                    # RAM labels are shared between all banks
+                    bank = 0
+                continue
+
+            match = map_symbol_regex.match(line)
+            if match is not None and bank is not None:
+                self.add_symbol(bank, int(match.group(1), 16), match.group(2))
+
+        f.close()
+
+
+    def disassemble(self, output):
+        self.output = output
+
+        backends = [output_backends[name](self) for name in args.format]
+        record = any(backend.uses_records for backend in backends)
+
+        # fingerprints of what the output depends on, taken before the first pass resolves the blocks
+        manifest = self.format_manifest()
+
+        reused_banks = set()
+        if args.diff is not None:
+            base = self.load_base_rom(args.diff)
+
+            # the output can only be reused if it was generated from the base rom with the same options
+            base_manifest = self.read_manifest(base, manifest)
+            if base_manifest is None and self.output.existed and not args.overwrite:
+                abort('Output directory {} already exists and was not generated from "{}" with the same options!'.format(
+                    self.output.description, args.diff
+                ))
+
+            unchanged_banks = self.compare_with_base(args.diff, base)
+
+            # labels for functions, control flow graphs, emulated far jumps, data and ram need every bank
+            if (
+                base_manifest is not None and
+                not args.split_functions and args.cfg is None and args.emulate is None and
+                not args.data_labels and not args.ram_layout
+            ):
+                reused_banks = set(
+                    bank for bank in unchanged_banks
+                    if base_manifest['banks'].get(bank) == manifest['banks'][bank] and all(backend.reuse_bank(bank) for backend in backends)
+                )
+
+            print('Reusing the output of {} unchanged banks'.format(len(reused_banks)))
+
+        # identical banks are only disassembled once, unless the functions in each bank are needed
+        if not args.split_functions and args.cfg is None:
+            self.find_duplicate_banks(reused_banks)
+
+        print('Generating labels...')
+        self.generate_labels(reused_banks)
+
+        if args.ram_layout:
+            self.add_ram_labels()
+
+        if args.duplicates:
+            self.write_duplicates(reused_banks)
+
+        # last bank that uses the output of each bank that has duplicates
+        last_duplicates = dict((source, bank) for bank, source in sorted(self.duplicate_banks.items()))
+
+        print('Generating disassembly', end='')
+        if debug:
+            print('')
+
+        for bank in range(0, self.num_banks):
+            if not debug:
+                # progress indicator
+                print('.', end='', flush=True)
+
+            if bank in reused_banks:
+                continue
+
+            source = self.duplicate_banks.get(bank)
+            if source is not None:
+                output = self.banks[bank].copy_output(self.banks[source])
+            else:
+                output = self.banks[bank].disassemble(self, record = record)
+
+            for backend in backends:
+                backend.write_bank(bank, output)
+
+            if bank not in last_duplicates:
+                self.banks[bank].release_output()
+
+            if source is not None and last_duplicates[source] == bank:
+                self.banks[source].release_output()
+
+        for backend in backends:
+            backend.finish()
+
+        if self.output.reusable:
+            self.write_manifest(manifest)
+
+        if args.cfg == 'dot':
+            self.write_cfg_dot()
+        elif args.cfg == 'json':
+            self.write_cfg_json()
+
+        self.output.close()
+
+        print('\nDisassembly generated in {}'.format(self.output.description))
+
+        
+    def generate_labels(self, skipped_banks = ()):
+        record = args.split_functions or args.cfg is not None
+
+        for bank in range(0, self.num_banks):
+            if bank in skipped_banks:
+                continue
+
+            if bank in self.duplicate_banks:
+                self.banks[bank].copy_labels(self.banks[self.duplicate_banks[bank]])
+            else:
+                self.banks[bank].disassemble(self, True, record)
+
+                while self.banks[bank].reject_detected_blocks(self):
+                    self.banks[bank].disassemble(self, True, record)
+
+            # data labels can be used by any bank, so they are added once every bank has been through the first pass
+            if not args.data_labels:
+                self.finalize_bank_labels(bank, record)
+
+        if args.data_labels:
+            self.add_data_labels(skipped_banks)
+
+            for bank in range(0, self.num_banks):
+                if bank not in skipped_banks:
+                    self.finalize_bank_labels(bank, record)
+
+
+    def finalize_bank_labels(self, bank, record):
+        self.banks[bank].finalize_labels()
+
+        # identical banks are not found when the functions are needed
+        if bank not in self.duplicate_banks:
+            if record:
+                self.banks[bank].find_functions()
+
+            if args.cfg is not None:
+                self.banks[bank].build_control_flow_graphs()
+
+        self.banks[bank].compact()
+
+
+    def add_data_labels(self, skipped_banks = ()):
+        """
+        Label the rom addresses loaded by ld hl, d16 and ld de, d16 instructions that are likely to
+        be data. Each address gets a confidence score from the block it is in, plus one for each
+        extra instruction that loads it, and is only labelled if the score is high enough, so
+        constants that happen to look like rom addresses are left as numbers. Addresses that score
+        0 are never labelled, as a label could not be output there.
+        """
+        references = dict()
+        for bank_number in range(0, self.num_banks):
+            if bank_number not in skipped_banks:
+                for target in self.banks[bank_number].data_references.values():
+                    references[target] = references.get(target, 0) + 1
+
+        for (bank_number, address), count in references.items():
+            bank = self.banks[bank_number]
+
+            label = bank.labelled_addresses.get(address)
+            if label is not None and '.' in label:
+                # local labels cannot be used outside of their scope
+                continue
+
+            confidence = bank.get_data_label_confidence(address)
+            if confidence == 0:
+                # no label can be output here, however many instructions load it
+                continue
+
+            confidence += min(count - 1, MAX_DATA_LABEL_REFERENCE_CONFIDENCE)
+            if confidence >= MIN_DATA_LABEL_CONFIDENCE:
+                bank.data_labels[address] = label or bank.format_label('ld', address)
+
+        if debug:
+            print('Added {} data labels'.format(sum(len(bank.data_labels) for bank in self.banks.values())))
+
+
+    def add_ram_labels(self):
+        """
+        Label every address in the ram sections that is accessed by the code and has no label yet.
+        """
+        ram_accesses = set()
+        for bank in self.banks.values():
+            ram_accesses.update(bank.ram_accesses)
+
+        for filename, prefix, section_name, section_type, start, end in ram_sections:
+            for address in range(start, end):
+                if address in ram_accesses and address not in self.ram_labels:
+                    self.ram_labels[address] = '{}Unk_{:04x}'.format(prefix, address)
+
+
+    def get_ram_layout(self):
+        """
+        Return (file, section name, section type, start, end, labels) for each ram section that has
+        any labels, where labels is a sorted list of (address, label).
+        """
+        layout = list()
+        for filename, prefix, section_name, section_type, start, end in ram_sections:
+            labels = sorted((address, label) for address, label in self.ram_labels.items() if start <= address < end)
+            if len(labels):
+                layout.append((filename, section_name, section_type, start, end, labels))
+
+        return layout
+
+
+    def find_duplicate_banks(self, skipped_banks = ()):
+        """
+        Find switchable banks that are identical to an earlier bank, including their labels and
+        blocks, so the earlier bank's disassembly can be reused for them.
+        """
+        first_banks = dict()
+        for bank_number in range(1, self.num_banks):
+            if bank_number in skipped_banks:
+                continue
+
+            # an instruction at the end of the bank reads the bytes after it
+            start = bank_number * 0x4000
+            contents = self.data[start:start + 0x4002]
+
+            source = first_banks.setdefault(contents, bank_number)
+            if source == bank_number:
+                continue
+
+            bank = self.banks[bank_number]
+            source_bank = self.banks[source]
+            if (
+                bank.labelled_addresses == source_bank.labelled_addresses and
+                bank.blocks == source_bank.blocks and
+                bank.detected_blocks == source_bank.detected_blocks
+            ):
+                self.duplicate_banks[bank_number] = source
+
+        if len(self.duplicate_banks):
+            print('Found {} banks that are identical to an earlier bank'.format(len(self.duplicate_banks)))
+
+
+    def write_duplicates(self, skipped_banks = ()):
+        """
+        Write the routines that appear more than once in the rom to duplicates.txt. Routines start at
+        call targets and global labels, and are compared with their 16 bit operands masked so copies
+        at different addresses are found.
+        """
+        routines = dict()
+        for bank_number in range(0, self.num_banks):
+            bank = self.banks[bank_number]
+            if bank_number in self.duplicate_banks or bank_number in skipped_banks:
+                continue
+
+            starts = set(address for address in bank.target_addresses['call'] if address in bank.disassembled_addresses)
+            starts.update(
+                address for address, label in bank.labelled_addresses.items()
+                if '.' not in label and address in bank.disassembled_addresses
+            )
+
+            bank_end_address = bank.rom_base_address + bank.memory_base_address + 0x4000
+            for address in sorted(starts):
+                pattern, word_offsets = self.fingerprint_function(bank.rom_base_address + address, bank_end_address)
+                if len(pattern) >= MIN_DUPLICATE_ROUTINE_LENGTH:
+                    routines.setdefault(tuple(pattern), list()).append((bank_number, address, bank.label_names[address][0]))
+
+        duplicates = sorted(
+            (locations for locations in routines.values() if len(locations) > 1),
+            key=lambda locations: locations[0][:2]
+        )
+
+        f = self.output.open('duplicates.txt')
+        f.write('; bank:address label for each copy of a routine\n')
+
+        for bank_number, source in sorted(self.duplicate_banks.items()):
+            f.write('; bank {:03x} is identical to bank {:03x}\n'.format(bank_number, source))
+
+        for locations in duplicates:
+            f.write(' '.join('{0:02x}:{1:04x} {2}'.format(*location) for location in locations) + '\n')
+
+        f.close()
+
+        print('Found {} routines with more than one copy'.format(len(duplicates)))
+
+
+    def load_base_rom(self, base_path):
+        if not os.path.isfile(base_path):
+            abort('Base ROM "{}" not found'.format(base_path))
+
+        f = open(base_path, 'rb')
+        base = f.read()
+        f.close()
+
+        return base
+
+
+    def format_manifest(self):
+        """
+        Return the fingerprints of the rom data, of the options and ram labels, and of the blocks and
+        labels of each bank, which together decide the output of each bank.
+        """
+        import hashlib
+
+        options = sorted((name, value) for name, value in vars(args).items() if name not in manifest_ignored_options)
+        options_fingerprint = hashlib.sha1(repr((__version__, options, sorted(self.ram_labels.items()))).encode('utf-8'))
+
+        banks = dict()
+        for bank_number in range(0, self.num_banks):
+            bank = self.banks[bank_number]
+            blocks = sorted((address, block['type'], block['length']) for address, block in bank.blocks.items())
+            labels = sorted(bank.labelled_addresses.items())
+            banks[bank_number] = hashlib.sha1(repr((blocks, labels)).encode('utf-8')).hexdigest()
+
+        return {
+            'rom': hashlib.sha1(self.data_view[:self.rom_size]).hexdigest(),
+            'options': options_fingerprint.hexdigest(),
+            'banks': banks
+        }
+
+
+    def read_manifest(self, base, manifest):
+        """
+        Read the manifest of the output directory, returning it if it was written for the base rom
+        with the same options as this run, otherwise None.
+        """
+        import hashlib
+
+        contents = self.output.read(MANIFEST_PATH)
+        if contents is None:
+            return None
+
+        base_manifest = {
+            'banks': dict()
+        }
+        for line in contents.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[0] in ['rom', 'options']:
+                base_manifest[parts[0]] = parts[1]
+            elif len(parts) == 3 and parts[0] == 'bank':
+                base_manifest['banks'][int(parts[1], 16)] = parts[2]
+
+        if base_manifest.get('rom') != hashlib.sha1(base).hexdigest():
+            return None
+
+        if base_manifest.get('options') != manifest['options']:
+            return None
+
+        return base_manifest
+
+
+    def write_manifest(self, manifest):
+        f = self.output.open(MANIFEST_PATH)
+        f.write('; written by mgbdis, used by --diff to reuse the output of unchanged banks\n')
+        f.write('rom {}\n'.format(manifest['rom']))
+        f.write('options {}\n'.format(manifest['options']))
+        for bank_number in range(0, self.num_banks):
+            f.write('bank {0:03x} {1}\n'.format(bank_number, manifest['banks'][bank_number]))
+        f.close()
+
+
+    def compare_with_base(self, base_path, base):
+        """
+        Compare the rom with the base rom it was modified from, writing the ranges of bytes that
+        changed to changes.txt. Returns the numbers of the banks that are identical in both roms.
+
+        Banks are compared in blocks of DIFF_BLOCK_SIZE bytes, and only the blocks that differ are
+        compared byte by byte.
+        """
+        print('Comparing with "{}"...'.format(base_path))
+
+        unchanged_banks = list()
+        changes = list()
+        for bank_number in range(0, self.num_banks):
+            start = bank_number * 0x4000
+            end = start + 0x4000
+
+            if self.data_view[start:end] == base[start:end]:
+                unchanged_banks.append(bank_number)
+                continue
+
+            bank_changes = list()
+            for block_start in range(start, end, DIFF_BLOCK_SIZE):
+                block_end = block_start + DIFF_BLOCK_SIZE
+                if self.data_view[block_start:block_end] == base[block_start:block_end]:
+                    continue
+
+                for address in range(block_start, block_end):
+                    if address < len(base) and self.data[address] == base[address]:
+                        continue
+
+                    if len(bank_changes) and bank_changes[-1][1] == address:
+                        bank_changes[-1][1] = address + 1
+                    else:
+                        bank_changes.append([address, address + 1])
+
+            print('Bank {:03x}: {} bytes changed in {} ranges'.format(
+                bank_number, sum(change_end - change_start for change_start, change_end in bank_changes), len(bank_changes)
+            ))
+            changes.extend(bank_changes)
+
+        print('{} of {} banks are unchanged'.format(len(unchanged_banks), self.num_banks))
+
+        f = self.output.open('changes.txt')
+        f.write('; bank:start end length\n')
+        for change_start, change_end in changes:
+            f.write('{0:02x}:{1:04x} {2:04x} {3:x}\n'.format(
+                change_start // 0x4000,
+                rom_address_to_mem_address(change_start),
+                rom_address_to_mem_address(change_end - 1) + 1,
+                change_end - change_start
+            ))
+        f.close()
+
+        return unchanged_banks
+
+
+    def write_cfg_json(self):
+        functions = list()
+
+        for bank_number in range(0, self.num_banks):
+            bank = self.banks[bank_number]
+            for start, end, name in bank.functions:
+                functions.append({
+                    'bank': bank_number,
+                    'name': name,
+                    'start': start,
+                    'end': end,
+                    'blocks': [
+                        {
+                            'start': block_start,
+                            'end': block_end,
+                            'successors': list(successors),
+                            'calls': list(calls)
+                        }
+                        for block_start, block_end, successors, calls in bank.control_flow_graphs[start]
+                    ]
+                })
+
+        import json
+
+        f = self.output.open('cfg.json')
+        json.dump({'functions': functions}, f, separators=(',', ':'))
+        f.close()
+
+
+    def write_cfg_dot(self):
+        f = self.output.open('cfg.dot')
+
+        f.write('digraph cfg {\n')
+        f.write('    node [shape=box fontname="monospace"];\n')
+
+        for bank_number in range(0, self.num_banks):
+            bank = self.banks[bank_number]
+            for start, end, name in bank.functions:
+                f.write('    subgraph "cluster_{0:03x}_{1:04x}" {{\n'.format(bank_number, start))
+                f.write('        label="{}";\n'.format(name))
+
+                for block_start, block_end, successors, calls in bank.control_flow_graphs[start]:
+                    f.write('        "{0:03x}_{1:04x}" [label="{2}-{3}"];\n'.format(
+                        bank_number, block_start, hex_word(block_start), hex_word(block_end - 1)
+                    ))
+                    for successor in successors:
+                        f.write('        "{0:03x}_{1:04x}" -> "{0:03x}_{2:04x}";\n'.format(bank_number, block_start, successor))
+
+                f.write('    }\n')
+
+        f.write('}\n')
+        f.close()
+
+
+
+class DirectoryOutput:
+    """
+    Writes the output files into a directory.
+    """
+
+    concatenated = False
+    reusable = True
+
+    def __init__(self, output_dir):
+        self.output_directory = os.path.abspath(output_dir.rstrip(os.sep))
+        self.description = '"{}"'.format(self.output_directory)
+        self.existed = os.path.exists(self.output_directory)
+
+        if self.existed:
+            # when comparing with a base rom, the directory is checked once its manifest has been read
+            if not args.overwrite and args.diff is None:
+                abort('Output directory "{}" already exists!'.format(self.output_directory))
+
+            if not os.path.isdir(self.output_directory):
+                abort('Output path "{}" already exists and is not a directory!'.format(self.output_directory))
+        else:
+            os.makedirs(self.output_directory)
+
+
+    def open(self, path, mode = 'w'):
+        path = os.path.join(self.output_directory, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        return open(path, mode)
+
+
+    def read(self, path):
+        """
+        Return the contents of a file that is already in the directory, or None if it does not exist.
+        """
+        path = os.path.join(self.output_directory, path)
+        if not os.path.isfile(path):
+            return None
+
+        f = open(path, 'r')
+        contents = f.read()
+        f.close()
+
+        return contents
+
+
+    def close(self):
+        pass
+
+
+
+class StreamOutput:
+    """
+    Writes the assembly files straight after each other to a stream, as a single assembly file.
+    Files that are only needed to build a project, like the makefile, are left out.
+    """
+
+    concatenated = True
+    reusable = False
+    description = 'stdout'
+
+    def __init__(self, stream):
+        self.stream = stream
+
+
+    def open(self, path, mode = 'w'):
+        if os.path.splitext(path)[1] in ['.asm', '.inc']:
+            return StreamOutputFile(self.stream)
+
+        import io
+        if 'b' in mode:
+            return io.BytesIO()
+        return io.StringIO()
+
+
+    def close(self):
+        self.stream.flush()
+
+
+
+class StreamOutputFile:
+
+    def __init__(self, stream):
+        self.stream = stream
+
+
+    def write(self, text):
+        self.stream.write(text)
+
+
+    def close(self):
+        self.stream.write('\n')
+        self.stream.flush()
+
+
+
+class TarOutput:
+    """
+    Writes the output files to a stream as an uncompressed tar archive. Each file is added to the
+    archive as soon as it is closed.
+    """
+
+    concatenated = False
+    reusable = False
+    description = 'tar stream'
+
+    def __init__(self, stream):
+        import tarfile
+        self.tar = tarfile.open(fileobj=stream, mode='w|')
+
+
+    def open(self, path, mode = 'w'):
+        return TarOutputFile(self.tar, path, 'b' in mode)
+
+
+    def close(self):
+        self.tar.close()
+
+
+
+class TarOutputFile:
+
+    def __init__(self, tar, path, binary = False):
+        self.tar = tar
+        self.path = path
+        self.binary = binary
+        self.parts = list()
+
+
+    def write(self, data):
+        # binary data may be a memoryview of the rom, so copy it before the rom is released
+        self.parts.append(bytes(data) if self.binary else data)
+
+
+    def close(self):
+        import io
+        import tarfile
+        import time
+
+        if self.binary:
+            data = b''.join(self.parts)
+        else:
+            data = ''.join(self.parts).encode('utf-8')
+        info = tarfile.TarInfo(self.path)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+
+
+
+class RgbdsBackend:
+    """
+    Writes the disassembly as RGBDS assembly files, with a makefile to rebuild the ROM.
+    """
+
+    uses_records = False
+    subdirectory = None
+    source_extension = 'asm'
+
+    def __init__(self, rom):
+        self.rom = rom
+
+        # directory to write the files into, relative to the output
+        self.output_directory = self.subdirectory or ''
+
+        # (bank, start, end, name, path) of each file written by write_function_files
+        self.function_files = list()
+
+        # whether any data was written to binary files by write_binary_files
+        self.has_binary_files = False
+
+        # paths of the files written by write_ram_files
+        self.ram_files = list()
+
+        if rom.output.concatenated:
+            # the banks are written straight after each other, so everything they use must come first
+            if args.split_functions:
+                abort('Functions cannot be split into files when writing a single assembly file')
+
+            if args.incbin is not None:
+                abort('Data cannot be written to binary files when writing a single assembly file')
+
+            self.copy_hardware_inc()
+            self.write_macros()
+
+
+    def write_bank(self, bank, output):
+        path = os.path.join(self.output_directory, 'bank_{0:03x}.{1}'.format(bank, self.source_extension))
+        f = self.rom.output.open(path)
+
+        self.write_header(f)
+
+        if args.split_functions:
+            f.write(self.write_function_files(bank, self.translate_lines(bank, self.rom.banks[bank].output)))
+        else:
+            f.write(self.translate_bank(bank, output))
+
+        f.close()        
+
+        self.write_binary_files(bank)
+
+
+    def reuse_bank(self, bank):
+        """
+        Keep the file written for the bank when the base rom was disassembled, updating its header.
+        Only called for banks whose manifest entry matches. Returns False if the bank has to be
+        disassembled again.
+        """
+        path = os.path.join(self.output_directory, 'bank_{0:03x}.{1}'.format(bank, self.source_extension))
+        contents = self.rom.output.read(path)
+
+        base_header = self.format_header(args.diff)
+        if contents is None or not contents.startswith(base_header):
+            return False
+
+        header = self.format_header(self.rom.rom_path)
+        if header != base_header:
+            f = self.rom.output.open(path)
+            f.write(header)
+            f.write(contents[len(base_header):])
+            f.close()
+
+        # the macros and makefile depend on what the bank uses
+        if '    ld_long ' in contents:
+            self.rom.has_ld_long = True
+
+        if 'INCBIN "' in contents:
+            self.has_binary_files = True
+
+        return True
+
+
+    def write_binary_files(self, bank_number):
+        for path, start_address, end_address in self.rom.banks[bank_number].binary_segments:
+            f = self.rom.output.open(os.path.join(self.output_directory, path), 'wb')
+            f.write(self.rom.data_view[start_address:end_address])
+            f.close()
+
+            self.has_binary_files = True
+
+
+    def translate_bank(self, bank, output):
+        return '\n'.join(self.translate_lines(bank, self.rom.banks[bank].output))
+
+
+    def translate_lines(self, bank, lines):
+        """
+        Translate the rgbds output lines of a bank, returning exactly one string for each line.
+        """
+        return lines
+
+
+    def write_function_files(self, bank_number, lines):
+        """
+        Write each function in the bank to its own file, returning the bank file contents that
+        includes them.
+        """
+        bank = self.rom.banks[bank_number]
+        directory = 'bank_{0:03x}'.format(bank_number)
+
+        names = dict((start, name) for start, end, name in bank.functions)
+        split_indices = bank.function_output_indices + [(None, len(lines))]
+
+        bank_lines = lines[:split_indices[0][1]]
+        used_filenames = set()
+
+        for index in range(len(split_indices) - 1):
+            start, start_line = split_indices[index]
+            end_line = split_indices[index + 1][1]
+
+            filename = names[start]
+            if filename.lower() in used_filenames:
+                filename = '{}_{:04x}'.format(filename, start)
+            used_filenames.add(filename.lower())
+
+            path = os.path.join(directory, '{}.{}'.format(filename, self.source_extension))
+            f = self.rom.output.open(os.path.join(self.output_directory, path))
+            f.write('\n'.join(lines[start_line:end_line]))
+            f.write('\n')
+            f.close()
+
+            self.function_files.append((bank_number, start, bank.function_ends[start], names[start], path))
+            bank_lines.append(self.format_include(path))
+
+        return '\n'.join(bank_lines)
+
+
+    def format_include(self, path):
+        return 'INCLUDE "{}"'.format(path)
+
+
+    def write_function_index(self):
+        path = os.path.join(self.output_directory, 'functions.txt')
+        f = self.rom.output.open(path)
+
+        f.write('; bank:start end name file\n')
+        for bank, start, end, name, function_path in self.function_files:
+            f.write('{0:02x}:{1:04x} {2:04x} {3} {4}\n'.format(bank, start, end, name, function_path))
+
+        f.close()
+
+
+    def finish(self):
+        if args.ram_layout:
+            self.write_ram_files()
+
+        if self.rom.output.concatenated:
+            return
+
+        self.copy_hardware_inc()
+        self.write_game_asm()
+        self.write_makefile()
+
+        if args.split_functions:
+            self.write_function_index()
+
+
+    def write_ram_files(self):
+        sections = dict()
+        for filename, section_name, section_type, start, end, labels in self.rom.get_ram_layout():
+            sections.setdefault(filename, list()).append(self.format_ram_section(section_name, section_type, start, end, labels))
+
+        for filename in sections:
+            path = '{}.{}'.format(filename, self.source_extension)
+            f = self.rom.output.open(os.path.join(self.output_directory, path))
+            self.write_header(f)
+            f.write('\n\n'.join(sections[filename]))
+            f.write('\n')
+            f.close()
+
+            self.ram_files.append(path)
+
+
+    def format_ram_section(self, section_name, section_type, start, end, labels):
+        lines = ['SECTION "{}", {}[{}]'.format(section_name, section_type, hex_word(start)), '']
+
+        if labels[0][0] > start:
+            lines.append('    ds {}'.format(labels[0][0] - start))
+
+        for index, (address, label) in enumerate(labels):
+            next_address = labels[index + 1][0] if index < len(labels) - 1 else end
+            lines.append(label + '::')
+            lines.append('    ds {}'.format(next_address - address))
+
+        return '\n'.join(lines)
+
+
+    def write_header(self, f):
+        f.write(self.format_header(self.rom.rom_path))
+
+
+    def format_header(self, rom_path):
+        return (
+            '; Disassembly of "{}"\n'.format('stdin' if rom_path == '-' else os.path.basename(rom_path)) +
+            '; This file was created with {}\n'.format(app_name) +
+            '; https://github.com/mattcurrie/mgbdis\n\n'
+        )
+
+
+    def copy_hardware_inc(self):
+        f = open(os.path.join(self.rom.script_dir, 'hardware.inc'), 'r')
+        hardware_inc = f.read()
+        f.close()
+
+        f = self.rom.output.open(os.path.join(self.output_directory, 'hardware.inc'))
+        f.write(hardware_inc)
+        f.close()
+
+
+    def write_game_asm(self):
+        path = os.path.join(self.output_directory, 'game.asm')
+        f = self.rom.output.open(path)        
+
+        self.write_header(f)
+
+        if self.rom.has_ld_long:
+            self.write_ld_long_macro(f)
+
+        f.write('INCLUDE "hardware.inc"')
+        for path in self.ram_files:
+            f.write('\n' + self.format_include(path))
+        for bank in range(0, self.rom.num_banks):
+            f.write('\nINCLUDE "bank_{0:03x}.asm"'.format(bank))
+        f.close()
+
+
+    def write_macros(self):
+        f = self.rom.output.open(os.path.join(self.output_directory, 'macros.asm'))
+        self.write_ld_long_macro(f)
+        f.close()
+
+
+    def write_ld_long_macro(self, f):
+        f.write(
+"""ld_long: MACRO
+    IF STRLWR("\\1") == "a" 
+        ; ld a, [$ff40]
+        db $FA
+        dw \\2
+    ELSE 
+        IF STRLWR("\\2") == "a" 
+            ; ld [$ff40], a
             db $EA
             dw \\1
         ENDC
@@ -834,23 +3029,22 @@ ENDM
 
 """)
 
-        f.write('INCLUDE "hardware.inc"')
-        for bank in range(0, self.num_banks):
-            f.write('\nINCLUDE "bank_{0:03x}.asm"'.format(bank))
-        f.close()
-
 
     def write_makefile(self):
         rom_extension = 'gb'
-        if self.supports_gbc():
+        if self.rom.supports_gbc():
             rom_extension = 'gbc'
 
         path = os.path.join(self.output_directory, 'Makefile')
-        f = open(path, 'w')
+        f = self.rom.output.open(path)
 
         f.write('all: game.{}\n\n'.format(rom_extension))
 
-        f.write('game.o: game.asm bank_*.asm\n')
+        f.write('game.o: game.asm bank_*.asm{}{}{}\n'.format(
+            ''.join(' ' + path for path in self.ram_files),
+            ' bank_*/*.asm' if args.split_functions else '',
+            ' bin/*.bin' if self.has_binary_files else ''
+        ))
         f.write('\trgbasm -o game.o game.asm\n\n')
 
         f.write('game.{}: game.o\n'.format(rom_extension))
@@ -864,15 +3058,725 @@ ENDM
 
 
 
+class AsmotorBackend(RgbdsBackend):
+    """
+    Writes the disassembly as ASMotor assembly files. The syntax is the same as RGBDS apart from the
+    section definitions.
+    """
+
+    subdirectory = 'asmotor'
+
+    def translate_lines(self, bank, lines):
+        if bank == 0:
+            section = 'SECTION "ROM Bank ${0:03x}",HOME[$0]'.format(bank)
+        else:
+            section = 'SECTION "ROM Bank ${0:03x}",CODE[$4000],BANK[${0:x}]'.format(bank)
+
+        return [section] + lines[1:]
+
+
+    def format_ram_section(self, section_name, section_type, start, end, labels):
+        # the labels are defined as constants, as ram sections depend on the target
+        lines = ['; {} {}-{}'.format(section_name, hex_word(start), hex_word(end - 1))]
+        for address, label in labels:
+            lines.append('{} EQU {}'.format(label, hex_word(address)))
+
+        return '\n'.join(lines)
+
+
+    def write_makefile(self):
+        rom_extension = 'gb'
+        if self.rom.supports_gbc():
+            rom_extension = 'gbc'
+
+        path = os.path.join(self.output_directory, 'Makefile')
+        f = self.rom.output.open(path)
+
+        f.write('all: game.{}\n\n'.format(rom_extension))
+
+        f.write('game.o: game.asm bank_*.asm{}{}{}\n'.format(
+            ''.join(' ' + path for path in self.ram_files),
+            ' bank_*/*.asm' if args.split_functions else '',
+            ' bin/*.bin' if self.has_binary_files else ''
+        ))
+        f.write('\tmotorgb -o game.o game.asm\n\n')
+
+        f.write('game.{}: game.o\n'.format(rom_extension))
+        f.write('\txlink -fngb -mgame.map -o$@ $<\n\n')
+
+        f.write('clean:\n')
+        f.write('\trm -f game.o game.{}\n'.format(rom_extension))
+
+        f.close()
+
+
+
+class WlaDxBackend(RgbdsBackend):
+    """
+    Writes the disassembly as WLA-DX assembly files, translated from the decoded instructions of
+    each bank.
+    """
+
+    uses_records = True
+    subdirectory = 'wla-dx'
+    source_extension = 's'
+
+    def translate_lines(self, bank_number, output):
+        bank = self.rom.banks[bank_number]
+        records = dict((record[5], record) for record in bank.records)
+
+        lines = list()
+        for index, line in enumerate(output):
+            if index in records:
+                lines.append(self.format_instruction(bank, records[index], line))
+
+            elif line.startswith('SECTION'):
+                lines.append('.BANK {} SLOT {}\n.ORG $0000'.format(bank_number, 0 if bank_number == 0 else 1))
+
+            elif line.strip().startswith(('DB ', 'REPT ', 'ENDR')):
+                lines.append(line.replace('DB ', '.DB ', 1).replace('REPT ', '.REPT ', 1).replace('ENDR', '.ENDR', 1))
+
+            elif line.strip().startswith('INCBIN '):
+                lines.append(line.replace('INCBIN ', '.INCBIN ', 1))
+
+            elif line.endswith(':'):
+                lines.append('\n'.join(self.format_label(label.rstrip(':')) + ':' for label in line.split('\n')))
+
+            else:
+                lines.append(line)
+
+        return lines
+
+
+    def format_include(self, path):
+        return '.INCLUDE "{}"'.format(path)
+
+
+    def format_ram_section(self, section_name, section_type, start, end, labels):
+        lines = ['; {}'.format(section_name), '.ENUM {}'.format(hex_word(labels[0][0]))]
+
+        for index, (address, label) in enumerate(labels):
+            next_address = labels[index + 1][0] if index < len(labels) - 1 else end
+            lines.append('    {} DSB {}'.format(self.format_label(label), next_address - address))
+
+        lines.append('.ENDE')
+
+        return '\n'.join(lines)
+
+
+    def format_label(self, label):
+        # local labels are child labels in WLA-DX
+        if label[0] == '.':
+            return '@' + label[1:]
+        return label
+
+
+    def format_operand(self, address, operand):
+        if operand == '[hli]':
+            return '(hl+)'
+        if operand == '[hld]':
+            return '(hl-)'
+        if operand[0] == '[':
+            return '(' + self.format_label(operand[1:-1]) + ')'
+        if operand[0] == '@':
+            # there is no symbol for the current address, so use the absolute address instead
+            offset = int(operand[3:], 16)
+            return hex_word(address + offset if operand[1] == '+' else address - offset)
+        return self.format_label(operand)
+
+
+    def format_instruction(self, bank, record, line):
+        address, length, instruction_name, operand_values, target, output_index = record
+        rom_address = bank.rom_base_address + address
+        opcode = self.rom.data[rom_address]
+
+        comments = list()
+        if ';' in line:
+            comments.append(line[line.index(';') + 1:].strip())
+
+        if instruction_name == 'DB':
+            instruction = '.DB ' + ', '.join(operand_values)
+
+        elif instruction_name == 'ld_long':
+            # make sure the 3 byte form of the instruction is used
+            if operand_values[0] == 'a':
+                instruction = 'LD_LONG_FROM ' + operand_values[1]
+            else:
+                instruction = 'LD_LONG_TO ' + operand_values[0]
+
+        elif opcode in [0xe0, 0xf0]:
+            operand = '(' + hex_byte(self.rom.data[rom_address + 1]) + ')'
+            if opcode == 0xe0:
+                instruction = 'ldh {}, a'.format(operand)
+            else:
+                instruction = 'ldh a, {}'.format(operand)
+
+            register_name = self.rom.hardware_register_table[0xff00 + self.rom.data[rom_address + 1]]
+            if register_name is not None:
+                comments.insert(0, register_name)
+
+        elif instruction_name == 'halt' and length == 2:
+            instruction = 'halt\n    nop'
+
+        else:
+            instruction = '{} {}'.format(
+                instruction_name,
+                ', '.join(self.format_operand(address, operand) for operand in operand_values)
+            )
+
+        if len(comments):
+            return '{0:<50}; {1}'.format('    ' + instruction, '  '.join(comments))
+        return '    ' + instruction
+
+
+    def copy_hardware_inc(self):
+        path = os.path.join(self.output_directory, 'hardware.i')
+        f = self.rom.output.open(path)
+
+        for address in sorted(self.rom.hardware_registers):
+            f.write('.DEFINE {} {}\n'.format(self.rom.hardware_registers[address], hex_word(address)))
+
+        f.close()
+
+
+    def write_game_asm(self):
+        path = os.path.join(self.output_directory, 'game.s')
+        f = self.rom.output.open(path)
+
+        self.write_header(f)
+
+        f.write(
+""".MEMORYMAP
+    DEFAULTSLOT 1
+    SLOT 0 $0000 SIZE $4000
+    SLOT 1 $4000 SIZE $4000
+.ENDME
+
+.ROMBANKSIZE $4000
+.ROMBANKS {}
+
+.MACRO LD_LONG_FROM
+    ; ld a, [$ff40]
+    .DB $FA
+    .DW \\1
+.ENDM
+
+.MACRO LD_LONG_TO
+    ; ld [$ff40], a
+    .DB $EA
+    .DW \\1
+.ENDM
+
+""".format(self.rom.num_banks))
+
+        f.write('.INCLUDE "hardware.i"')
+        for path in self.ram_files:
+            f.write('\n' + self.format_include(path))
+        for bank in range(0, self.rom.num_banks):
+            f.write('\n.INCLUDE "bank_{0:03x}.s"'.format(bank))
+        f.close()
+
+
+    def write_makefile(self):
+        rom_extension = 'gb'
+        if self.rom.supports_gbc():
+            rom_extension = 'gbc'
+
+        path = os.path.join(self.output_directory, 'linkfile')
+        f = self.rom.output.open(path)
+        f.write('[objects]\ngame.o\n')
+        f.close()
+
+        path = os.path.join(self.output_directory, 'Makefile')
+        f = self.rom.output.open(path)
+
+        f.write('all: game.{}\n\n'.format(rom_extension))
+
+        f.write('game.o: game.s bank_*.s{}{}{}\n'.format(
+            ''.join(' ' + path for path in self.ram_files),
+            ' bank_*/*.s' if args.split_functions else '',
+            ' bin/*.bin' if self.has_binary_files else ''
+        ))
+        f.write('\twla-gb -o game.o game.s\n\n')
+
+        f.write('game.{}: game.o linkfile\n'.format(rom_extension))
+        f.write('\twlalink linkfile $@\n\n')
+
+        f.write('clean:\n')
+        f.write('\trm -f game.o game.{}\n'.format(rom_extension))
+
+        f.close()
+
+
+
+class JsonLinesBackend:
+    """
+    Writes the decoded disassembly to disassembly.jsonl, one JSON object per line, so it can be
+    processed by other tools without parsing the assembly.
+
+    Record types are "rom", "block", "label", "instruction" and "xref". Addresses are memory
+    addresses within the record's bank.
+    """
+
+    uses_records = True
+
+    def __init__(self, rom):
+        import json
+
+        self.rom = rom
+        self.encoder = json.JSONEncoder(separators=(',', ':'))
+        self.file = rom.output.open('disassembly.jsonl')
+
+        self.write_record({
+            'type': 'rom',
+            'path': os.path.basename(rom.rom_path),
+            'size': rom.rom_size,
+            'banks': rom.num_banks,
+            'gbc': rom.supports_gbc()
+        })
+
+
+    def write_record(self, record):
+        self.file.write(self.encoder.encode(record))
+        self.file.write('\n')
+
+
+    def reuse_bank(self, bank_number):
+        # all banks are written to a single file
+        return False
+
+
+    def write_bank(self, bank_number, output):
+        bank = self.rom.banks[bank_number]
+        bank_rom_address = bank.rom_base_address
+
+        for address in sorted(bank.blocks):
+            self.write_record({
+                'type': 'block',
+                'bank': bank_number,
+                'address': address,
+                'length': bank.blocks[address]['length'],
+                'block_type': bank.blocks[address]['type']
+            })
+
+        for address in sorted(bank.label_names):
+            for name in bank.label_names[address]:
+                self.write_record({
+                    'type': 'label',
+                    'bank': bank_number,
+                    'address': address,
+                    'name': name
+                })
+
+        data = self.rom.data
+        for address, length, instruction_name, operand_values, target, output_index in bank.records:
+            rom_address = bank_rom_address + address
+            self.write_record({
+                'type': 'instruction',
+                'bank': bank_number,
+                'address': address,
+                'bytes': data[rom_address:rom_address + length].hex(),
+                'mnemonic': instruction_name,
+                'operands': operand_values
+            })
+
+            if target is not None:
+                self.write_record({
+                    'type': 'xref',
+                    'bank': bank_number,
+                    'address': address,
+                    'target_bank': bank.get_target_bank(target),
+                    'target': target,
+                    'kind': instruction_name
+                })
+
+
+    def finish(self):
+        self.file.close()
+
+
+
+output_backends = {
+    'rgbds': RgbdsBackend,
+    'asmotor': AsmotorBackend,
+    'wla-dx': WlaDxBackend,
+    'jsonl': JsonLinesBackend
+}
+
+
+
+class BadRequestError(Exception):
+    """
+    A request to the disassembly server with a missing or invalid parameter.
+    """
+
+
+
+class NotFoundError(Exception):
+    """
+    A request to the disassembly server for a ROM or bank that does not exist.
+    """
+
+
+
+class CachedRom:
+    """
+    A ROM kept in memory by the disassembly server, with its labels generated. Banks are rendered
+    when they are first requested.
+    """
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.rom = ROM(path)
+        self.rom.generate_labels()
+
+        # (lines, records) of each rendered bank by bank number
+        self.rendered_banks = dict()
+
+        # (bank, address, kind) of each reference by (target bank, target), built when first requested
+        self.xrefs = None
+
+        label_count = sum(len(bank.labelled_addresses) for bank in self.rom.banks.values())
+        self.size = len(self.rom.data) + self.rom.num_banks * 0x1000 + label_count * 200
+
+
+    def get_bank(self, bank_number):
+        if bank_number not in self.rendered_banks:
+            bank = self.rom.banks[bank_number]
+            bank.disassemble(self.rom, record = True)
+            self.rendered_banks[bank_number] = (bank.output, bank.records)
+            self.size += sum(len(line) + 64 for line in bank.output) + len(bank.records) * 200
+            bank.release_output()
+
+        return self.rendered_banks[bank_number]
+
+
+    def get_xrefs(self):
+        if self.xrefs is None:
+            self.xrefs = dict()
+            for bank_number in range(0, self.rom.num_banks):
+                bank = self.rom.banks[bank_number]
+                lines, records = self.get_bank(bank_number)
+                for address, length, instruction_name, operand_values, target, output_index in records:
+                    if target is not None:
+                        key = (bank.get_target_bank(target), target)
+                        self.xrefs.setdefault(key, list()).append((bank_number, address, instruction_name))
+
+            self.size += sum(len(references) for references in self.xrefs.values()) * 100
+
+        return self.xrefs
+
+
+
+class DisassemblyServer:
+    """
+    Answers requests for the disassembly of ROMs on the local disk, keeping recently used ROMs in
+    memory until the estimated size of the cache goes over its limit.
+
+    Requests are paths with a query string, and every request has a "rom" parameter with the path
+    of the ROM. Addresses are hexadecimal memory addresses within the bank.
+
+        /rom                                    size, banks and whether the ROM supports the GBC
+        /bank?bank=1                            RGBDS assembly of a bank
+        /instructions?bank=1&start=4000&end=4100
+                                                decoded instructions in a range of a bank
+        /labels?bank=1                          labels, for all banks if no bank is given
+        /xrefs?bank=1&address=4000              instructions that jump to or call an address
+    """
+
+    def __init__(self, cache_size):
+        import collections
+
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+
+
+    def get_rom(self, path):
+        path = os.path.realpath(path)
+        if not os.path.isfile(path):
+            raise NotFoundError('"{}" not found'.format(path))
+
+        mtime = os.stat(path).st_mtime_ns
+        cached_rom = self.cache.get(path)
+        if cached_rom is None or cached_rom.mtime != mtime:
+            cached_rom = CachedRom(path, mtime)
+            self.cache[path] = cached_rom
+
+        self.cache.move_to_end(path)
+        return cached_rom
+
+
+    def evict(self):
+        # always keep the most recently used rom
+        while len(self.cache) > 1 and sum(cached_rom.size for cached_rom in self.cache.values()) > self.cache_size:
+            path, cached_rom = self.cache.popitem(last=False)
+            print('Removed "{}" from the cache'.format(path))
+
+
+    def handle_request(self, request_path, query):
+        """
+        Return the HTTP status, content type and body for a request.
+        """
+        import json
+
+        try:
+            if 'rom' not in query:
+                raise BadRequestError('Missing "rom" parameter')
+
+            cached_rom = self.get_rom(query['rom'])
+            rom = cached_rom.rom
+
+            if request_path == '/rom':
+                result = {
+                    'path': cached_rom.path,
+                    'size': rom.rom_size,
+                    'banks': rom.num_banks,
+                    'gbc': rom.supports_gbc()
+                }
+
+            elif request_path == '/bank':
+                lines, records = cached_rom.get_bank(self.get_bank_number(rom, query))
+                return 200, 'text/plain; charset=utf-8', '\n'.join(lines) + '\n'
+
+            elif request_path == '/instructions':
+                bank_number = self.get_bank_number(rom, query)
+                start = self.get_address(query, 'start')
+                end = self.get_address(query, 'end')
+                bank_rom_address = rom.banks[bank_number].rom_base_address
+
+                lines, records = cached_rom.get_bank(bank_number)
+                result = list()
+                for address, length, instruction_name, operand_values, target, output_index in records:
+                    if start <= address < end:
+                        rom_address = bank_rom_address + address
+                        result.append({
+                            'address': address,
+                            'bytes': rom.data[rom_address:rom_address + length].hex(),
+                            'mnemonic': instruction_name,
+                            'operands': operand_values,
+                            'text': lines[output_index].split(';')[0].strip()
+                        })
+
+            elif request_path == '/labels':
+                if 'bank' in query:
+                    bank_numbers = [self.get_bank_number(rom, query)]
+                else:
+                    bank_numbers = range(0, rom.num_banks)
+
+                result = list()
+                for bank_number in bank_numbers:
+                    bank = rom.banks[bank_number]
+                    for address in sorted(bank.label_names):
+                        for name in bank.label_names[address]:
+                            result.append({'bank': bank_number, 'address': address, 'name': name})
+
+            elif request_path == '/xrefs':
+                bank_number = self.get_bank_number(rom, query)
+                address = self.get_address(query, 'address')
+                target_bank = rom.banks[bank_number].get_target_bank(address)
+
+                result = [
+                    {'bank': bank, 'address': source_address, 'kind': kind}
+                    for bank, source_address, kind in cached_rom.get_xrefs().get((target_bank, address), [])
+                ]
+
+            else:
+                return 404, 'text/plain; charset=utf-8', 'Unknown request "{}"\n'.format(request_path)
+
+        except NotFoundError as e:
+            return 404, 'text/plain; charset=utf-8', '{}\n'.format(e.args[0])
+        except BadRequestError as e:
+            return 400, 'text/plain; charset=utf-8', '{}\n'.format(e.args[0])
+        except Exception:
+            # anything else is a bug in the disassembler, so log it rather than blaming the request
+            import traceback
+            traceback.print_exc()
+            return 500, 'text/plain; charset=utf-8', 'Internal error\n'
+        finally:
+            self.evict()
+
+        return 200, 'application/json', json.dumps(result)
+
+
+    def get_bank_number(self, rom, query):
+        bank_number = self.get_number(query, 'bank', 10)
+        if bank_number not in rom.banks:
+            raise NotFoundError('Bank {} not found'.format(bank_number))
+        return bank_number
+
+
+    def get_address(self, query, name):
+        return self.get_number(query, name, 16)
+
+
+    def get_number(self, query, name, base):
+        if name not in query:
+            raise BadRequestError('Missing "{}" parameter'.format(name))
+
+        try:
+            return int(query[name].lstrip('$'), base)
+        except ValueError:
+            raise BadRequestError('Invalid "{}" parameter: {}'.format(name, query[name]))
+
+
+
 app_name = 'mgbdis v{version} - Game Boy ROM disassembler by {author}.'.format(version=__version__, author=__author__)
-parser = argparse.ArgumentParser(description=app_name)
-parser.add_argument('rom_path', help='Game Boy (Color) ROM file to disassemble')
-parser.add_argument('--output-dir', default='disassembly', help='Directory to write the files into. Defaults to "disassembly"', action='store')
-parser.add_argument('--overwrite', help='Allow generating a disassembly into an already existing directory', action='store_true')
-parser.add_argument('--debug', help='Display debug output', action='store_true')
-args = parser.parse_args()
 
-debug = args.debug
+# set from the command line arguments by main()
+args = None
+debug = False
+listing = False
+
+
+def parse_args(argv = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=app_name)
+    parser.add_argument('rom_path', help='Game Boy (Color) ROM file to disassemble, or "-" to read it from stdin')
+    parser.add_argument('--output-dir', default='disassembly', help='Directory to write the files into, or "-" to write a single assembly file to stdout. Defaults to "disassembly"', action='store')
+    parser.add_argument('--tar', help='Write the files to stdout as a tar archive instead of into a directory', action='store_true')
+    parser.add_argument('--duplicates', help='Write the routines that appear more than once in the ROM to duplicates.txt', action='store_true')
+    parser.add_argument('--diff', help='Base ROM that this ROM was modified from. Only banks that differ from it are disassembled, the output of the other banks is reused from the output directory', metavar='BASE_ROM')
+    parser.add_argument('--overwrite', help='Allow generating a disassembly into an already existing directory', action='store_true')
+    parser.add_argument('--format', help='Output format, "rgbds", "asmotor" or "wla-dx" for assembly, or "jsonl" for JSON Lines records. Can be used multiple times. Defaults to "rgbds"', choices=sorted(output_backends), action='append')
+    parser.add_argument('--sym', help='Additional symbol file to load (RGBDS, BGB, SameBoy, Emulicious or no$gmb format). Can be used multiple times', action='append', default=[])
+    parser.add_argument('--map', help='Additional RGBDS map file to load labels from. Can be used multiple times', action='append', default=[])
+    parser.add_argument('--port-symbols', help='Write a symbol file for the ROM by matching the functions of another version of the ROM, and exit', nargs=2, metavar=('OLD_ROM', 'OLD_SYM'))
+    parser.add_argument('--signatures', help='Signature file of known routines and data to label. Can be used multiple times', action='append', default=[])
+    parser.add_argument('--cdl', help='Code/data log to create code and data blocks from', action='store')
+    parser.add_argument('--cdl-unknown', help='Block type for bytes that were not accessed in the code/data log. Defaults to "data" with --cdl, otherwise "code"', choices=['code', 'data'])
+    parser.add_argument('--emulate', help='Run the ROM in an emulator for FRAMES frames (default {}) and use the code that was executed and the data that was read'.format(DEFAULT_EMULATION_FRAMES), metavar='FRAMES', type=int, nargs='?', const=DEFAULT_EMULATION_FRAMES)
+    parser.add_argument('--detect-data', help='Detect padding, tile graphics and pointer tables and output them as data', action='store_true')
+    parser.add_argument('--data-labels', help='Label ROM addresses loaded by "ld hl, d16" and "ld de, d16" when they are likely to be data', action='store_true')
+    parser.add_argument('--ram-layout', help='Label the external, work and high RAM addresses used by the code, and reserve them in sram.asm, wram.asm and hram.asm', action='store_true')
+    parser.add_argument('--incbin', help='Write data blocks of at least SIZE bytes (default {}) to binary files included with INCBIN'.format(MIN_INCBIN_LENGTH), metavar='SIZE', type=int, nargs='?', const=MIN_INCBIN_LENGTH)
+    parser.add_argument('--split-functions', help='Write each function to its own file, with an index in functions.txt', action='store_true')
+    parser.add_argument('--cfg', help='Write the control flow graph of each function to cfg.dot or cfg.json', choices=['dot', 'json'], action='store')
+    parser.add_argument('--listing', help='Add the bank, address and raw bytes of each instruction as a comment', action='store_true')
+    parser.add_argument('--debug', help='Display debug output', action='store_true')
+    arguments = parser.parse_args(argv)
+
+    if arguments.format is None:
+        arguments.format = ['rgbds']
+
+    if arguments.cdl_unknown is None:
+        # the emulator only runs the code for the first few seconds, so keep the rest as code
+        arguments.cdl_unknown = 'data' if arguments.cdl is not None else 'code'
+
+    if arguments.output_dir == '-' and (len(arguments.format) != 1 or arguments.format[0] not in ['rgbds', 'asmotor']):
+        parser.error('only a single rgbds or asmotor format can be written to stdout, use --tar for other formats')
+
+    return arguments
+
+
+def parse_serve_args(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='mgbdis.py serve', description=app_name + ' Disassembly server.')
+    parser.add_argument('--host', help='Address to listen on. Defaults to "127.0.0.1"', default='127.0.0.1')
+    parser.add_argument('--port', help='Port to listen on. Defaults to 8000', type=int, default=8000)
+    parser.add_argument('--socket', help='Unix socket to listen on instead of a TCP port', action='store')
+    parser.add_argument('--cache-size', help='Approximate memory limit for the cached ROMs in megabytes. Defaults to 256', type=int, default=256)
+    parser.add_argument('--detect-data', help='Detect padding, tile graphics and pointer tables and output them as data', action='store_true')
+    parser.add_argument('--data-labels', help='Label ROM addresses loaded by "ld hl, d16" and "ld de, d16" when they are likely to be data', action='store_true')
+    parser.add_argument('--debug', help='Display debug output', action='store_true')
+    return parser.parse_args(argv)
+
+
+def serve(argv):
+    global args, debug
+
+    import http.server
+    import socketserver
+    import urllib.parse
+
+    serve_args = parse_serve_args(argv)
+
+    # the disassembly options used for every rom, symbol files next to each rom are loaded automatically
+    args = parse_args(
+        ['-'] + (['--detect-data'] if serve_args.detect_data else []) + (['--data-labels'] if serve_args.data_labels else [])
+    )
+    debug = serve_args.debug
+
+    server = DisassemblyServer(serve_args.cache_size * 1024 * 1024)
+
+    class RequestHandler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+
+            status, content_type, body = server.handle_request(url.path, query)
+
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+
+        def address_string(self):
+            # unix socket clients have no address
+            return self.client_address[0] if self.client_address else serve_args.socket
+
+
+    if serve_args.socket is not None:
+        if os.path.exists(serve_args.socket):
+            os.remove(serve_args.socket)
+        http_server = socketserver.UnixStreamServer(serve_args.socket, RequestHandler)
+        print('Serving on {}'.format(serve_args.socket))
+    else:
+        http_server = http.server.HTTPServer((serve_args.host, serve_args.port), RequestHandler)
+        print('Serving on http://{}:{}/'.format(serve_args.host, serve_args.port))
+
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+
+
+def main(argv = None):
+    global args, debug, listing
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv[:1] == ['serve']:
+        serve(argv[1:])
+        return
+
+    args = parse_args(argv)
+    debug = args.debug
+    listing = args.listing
+
+    if args.diff is not None and (args.tar or args.output_dir == '-'):
+        abort('The output of unchanged banks can only be reused when writing to an output directory')
+
+    if args.tar or args.output_dir == '-':
+        # keep stdout for the output, and send any messages to stderr
+        stream = sys.stdout
+        sys.stdout = sys.stderr
+
+        if args.tar:
+            output = TarOutput(stream.buffer)
+        else:
+            output = StreamOutput(stream)
+
+    rom = ROM(args.rom_path)
+
+    if args.port_symbols is not None:
+        rom.port_symbols(*args.port_symbols)
+        return
+
+    if not args.tar and args.output_dir != '-':
+        output = DirectoryOutput(args.output_dir)
+
+    rom.disassemble(output)
+
 
-rom = ROM(args.rom_path)
-rom.disassemble(args.output_dir)
+if __name__ == '__main__':
+    main()